@@ -1,14 +1,45 @@
+import os
+
 import streamlit as st
-import requests
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
+
+import diagnostics
+from array_cache import cached_arrays, shared_cache
+from breadth import SPECULATION_HORIZONS, breadth_frame, breadth_spreads, load_price_panel, speculation_index, split_benchmark
+from charts import decimated_scatter, view_slice
+from data_sources import data_source
+from diagnostics import cached_stage, stage
+from exports import FORMATS, deferred_export, file_name, mime_type
+from sheet_cache import frame_to_dataset
+
+# Optional local coins x dates close-price panel (CSV or Parquet) to compute breadth from
+PRICE_PANEL = os.environ.get("TRW_PRICE_PANEL")
+# Optional .npz file with the per-coin indicator state, so only new days are computed
+BREADTH_STATE = os.environ.get("TRW_BREADTH_STATE")
+
+@cached_stage("local_breadth", st.cache_resource(ttl=600))
+def get_local_breadth(path, state_path):
+    # Compute the breadth series locally from the price panel, shared read-only across sessions
+    return frame_to_dataset(breadth_frame(path, state_path=state_path), trim=False, derive=breadth_spreads)
+
+@cached_stage("local_speculation", cached_arrays(ttl=600, dtype=np.float32))
+def get_local_speculation(path, horizons, rule):
+    # Recompute the Robust Speculation Index for a custom horizon set and rule, shared read-only
+    # across sessions in float32 as it is only plotted
+    dates, coins, closes = load_price_panel(path)
+    coins, closes, btc_closes = split_benchmark(coins, closes)
+    return speculation_index(closes, btc_closes, horizons=horizons, rule=rule)
 
-@st.cache_data(ttl=600)
 def get_data(sheet_name):
-    # Fetch data from the Google Apps Script API using the specified sheet name
-    url = f'https://script.google.com/macros/s/AKfycbyArX-VqTB_BGt_iRJ-2vCPu1mfY4McZw85m7XJu6nOeXvwt1suVoCwAhPdYlNdRrQn/exec?sheet={sheet_name}'
-    response = requests.get(url)  # Send a GET request to the API
-    return response
+    if PRICE_PANEL:
+        return get_local_breadth(PRICE_PANEL, BREADTH_STATE)
+    # Load the sheet from the configured data source (by default the Google Apps Script API through
+    # the persistent local cache, which serves stale data right away while newer rows are fetched
+    # in the background). It is parsed once per data version into a shared columnar dataset with
+    # the spreads precomputed
+    return data_source().load_dataset(sheet_name, trim=False, derive=breadth_spreads)
 
 # Configure the Streamlit page layout to be wide
 st.set_page_config(
@@ -16,6 +47,12 @@ st.set_page_config(
   page_title = "Crypto Breadth"
 )
 
+# Stage timings of this run, shown at the bottom when TRW_DIAGNOSTICS is set
+diagnostics.start_run()
+
+# Warm the TPI Backtest returns in the background while this page loads its own sheet
+data_source().prefetch(["R1"])
+
 
 # Subtitle for the Crypto Breadth section
 st.markdown("<h1 style='text-align: center;'>Crypto Breadth</h1>", unsafe_allow_html=True)
@@ -43,18 +80,27 @@ with col2:
         ('SMA', 'EMA', 'RSI'),  # Options available in the dropdown
     )
 
-response = get_data("API_DATA")
+with stage("get_data", sheet="API_DATA"):
+    data = get_data("API_DATA")
+
+# Date range shown in the charts, each trace is decimated to a pixel-appropriate number of points
+# within it so zooming in here brings back the full daily detail
+first_date = pd.Timestamp(data["date"][0]).date()
+last_date = pd.Timestamp(data["date"][-1]).date()
+col4_1, col4_2, col4_3 = st.columns([2, 3, 2])
+with col4_2:
+    date_range = st.slider("Date Range", min_value=first_date, max_value=last_date, value=(first_date, last_date))
+view = view_slice(data["date"], date_range)
 
 if True:  # Using True to always enter the block (could be removed for clarity)
     try:
-        data = response.json()  # Parse the response as JSON
-        dates = data["date"]  # Extract date values
-        sma50 = data["50sma"]  # Extract 50-period SMA values
-        sma200 = data["200sma"]  # Extract 200-period SMA values
-        ema50 = data["50ema"]  # Extract 50-period EMA values
-        ema200 = data["200ema"]  # Extract 200-period EMA values
-        rsi50 = data["50rsi"]  # Extract 50-period RSI values
-        btc = data["btc"]  # Extract BTC price values
+        dates = data["date"][view]  # Extract date values
+        sma50 = data["50sma"][view]  # Extract 50-period SMA values
+        sma200 = data["200sma"][view]  # Extract 200-period SMA values
+        ema50 = data["50ema"][view]  # Extract 50-period EMA values
+        ema200 = data["200ema"][view]  # Extract 200-period EMA values
+        rsi50 = data["50rsi"][view]  # Extract 50-period RSI values
+        btc = data["btc"][view]  # Extract BTC price values
 
         # Create an interactive plot with Plotly
         fig = go.Figure()
@@ -62,14 +108,14 @@ if True:  # Using True to always enter the block (could be removed for clarity)
         # Conditional plotting based on the dropdown selection
         if option == 'SMA':
             # Plot SMA50 and SMA200 if SMA is selected
-            fig.add_trace(go.Scatter(
+            fig.add_trace(decimated_scatter(
                 x=dates, y=sma50, 
                 mode='lines', 
                 name='50 SMA', 
                 line=dict(color='green', width=2),  
                 yaxis='y1'  # First y-axis
             ))
-            fig.add_trace(go.Scatter(
+            fig.add_trace(decimated_scatter(
                 x=dates, y=sma200, 
                 mode='lines', 
                 name='200 SMA', 
@@ -78,14 +124,14 @@ if True:  # Using True to always enter the block (could be removed for clarity)
             ))
         elif option == 'EMA':
             # Plot EMA50 and EMA200 if EMA is selected
-            fig.add_trace(go.Scatter(
+            fig.add_trace(decimated_scatter(
                 x=dates, y=ema50, 
                 mode='lines', 
                 name='50 EMA', 
                 line=dict(color='pink', width=2),  
                 yaxis='y1'  # First y-axis
             ))
-            fig.add_trace(go.Scatter(
+            fig.add_trace(decimated_scatter(
                 x=dates, y=ema200, 
                 mode='lines', 
                 name='200 EMA', 
@@ -94,7 +140,7 @@ if True:  # Using True to always enter the block (could be removed for clarity)
             ))
         elif option == 'RSI':
             # Plot RSI50 if RSI is selected
-            fig.add_trace(go.Scatter(
+            fig.add_trace(decimated_scatter(
                 x=dates, y=rsi50, 
                 mode='lines', 
                 name='50 RSI', 
@@ -103,7 +149,7 @@ if True:  # Using True to always enter the block (could be removed for clarity)
             ))
 
         # Plot BTC on the secondary y-axis regardless of the selection
-        fig.add_trace(go.Scatter(
+        fig.add_trace(decimated_scatter(
             x=dates, y=btc, 
             mode='lines', 
             name='BTC', 
@@ -148,7 +194,8 @@ if True:  # Using True to always enter the block (could be removed for clarity)
         )
 
         # Display the interactive plot in Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+        with stage("render_chart", chart="breadth"):
+            st.plotly_chart(fig, use_container_width=True)
 
     except Exception as e:
         # Handle any errors that occur during data fetching or processing
@@ -166,23 +213,22 @@ if not (option == "RSI"):
         unsafe_allow_html=True)
 
     try:
-        data = response.json()
-        dates = data["date"]
-        sma50 = data["50sma"]  # Extract 50-period SMA values
-        sma200 = data["200sma"]  # Extract 200-period SMA values
-        ema50 = data["50ema"]  # Extract 50-period EMA values
-        ema200 = data["200ema"]  # Extract 200-period EMA values
-        btc = data["btc"]  # Extract BTC price 
+        dates = data["date"][view]
+        sma50 = data["50sma"][view]  # Extract 50-period SMA values
+        sma200 = data["200sma"][view]  # Extract 200-period SMA values
+        ema50 = data["50ema"][view]  # Extract 50-period EMA values
+        ema200 = data["200ema"][view]  # Extract 200-period EMA values
+        btc = data["btc"][view]  # Extract BTC price 
         
-        # Calculate the Breadth Spread
-        sma_ratio = [s50 - s200 for s50, s200 in zip(sma50, sma200)]
-        ema_ratio = [e50 - e200 for e50, e200 in zip(ema50, ema200)]
+        # Breadth Spread, precomputed in the dataset
+        sma_ratio = data["sma_spread"][view]
+        ema_ratio = data["ema_spread"][view]
 
         fig1 = go.Figure()
 
         if option == 'SMA':
             # Plot SMA50 and SMA200 if SMA is selected
-            fig1.add_trace(go.Scatter(
+            fig1.add_trace(decimated_scatter(
                 x=dates, y=sma_ratio, 
                 mode='lines', 
                 name='SMA Spread', 
@@ -192,7 +238,7 @@ if not (option == "RSI"):
 
         elif option == 'EMA':
             # Plot EMA50 and EMA200 if EMA is selected
-            fig1.add_trace(go.Scatter(
+            fig1.add_trace(decimated_scatter(
                 x=dates, y=ema_ratio, 
                 mode='lines', 
                 name='EMA Spread', 
@@ -201,7 +247,7 @@ if not (option == "RSI"):
             ))
 
                 # Plot BTC on the secondary y-axis regardless of the selection
-        fig1.add_trace(go.Scatter(
+        fig1.add_trace(decimated_scatter(
             x=dates, y=btc, 
             mode='lines', 
             name='BTC', 
@@ -245,7 +291,8 @@ if not (option == "RSI"):
             font=dict(color="white")  # Set font color to white for visibility on dark background
         )
 
-        st.plotly_chart(fig1, use_container_width=True)
+        with stage("render_chart", chart="breadth_difference"):
+            st.plotly_chart(fig1, use_container_width=True)
 
     except Exception as e:
         # Handle any errors that occur during data fetching or processing
@@ -259,18 +306,26 @@ st.markdown("<h1 style='text-align: center;'>Robust Speculation Index</h1>", uns
 # Description of the Robust Speculation Index
 st.markdown("<p style='text-align: center;'>Robust Speculation Index is calculated as the percentage of altcoins with 75-day, 80-day, 85-day, 90-day, 95-day, 100-day, 105-day returns greater than Bitcoin. High readings suggest mounting speculation. Lower readings suggest capitulation, and potentially greater investment opportunities in altcoins. 1 = all periods have greater returns than BTC, 0 = not all periods have greater returns than BTC.</p>", unsafe_allow_html=True)
 
+if PRICE_PANEL:
+    # With a local price panel the horizons and the rule can be changed
+    col3_1, col3_2, col3_3 = st.columns([3, 2, 3])
+    with col3_2:
+        horizons = st.multiselect("Horizons (days)", options=list(range(30, 185, 5)), default=list(SPECULATION_HORIZONS))
+        rule = st.radio("Count a coin when it beats BTC on", ("all", "majority"), format_func=lambda r: f"{r} horizons", horizontal=True)
+
 if True:  # Using True to always enter the block (could be removed for clarity)
     try:
-        data = response.json()  # Parse the response as JSON
-        dates = data["date"]  # Extract date values
-        spec = data["spec"]  # Extract speculation index values
-        btc = data["btc"]  # Extract BTC price values
+        dates = data["date"][view]  # Extract date values
+        spec = data["spec"][view]  # Extract speculation index values
+        if PRICE_PANEL and horizons and (tuple(horizons) != SPECULATION_HORIZONS or rule != "all"):
+            spec = get_local_speculation(PRICE_PANEL, tuple(sorted(horizons)), rule)[view]
+        btc = data["btc"][view]  # Extract BTC price values
 
         # Create an interactive plot for the Robust Speculation Index
         fig2 = go.Figure()
 
         # Plot the Speculation Index on the primary y-axis
-        fig2.add_trace(go.Scatter(
+        fig2.add_trace(decimated_scatter(
             x=dates, y=spec, 
             mode='lines', 
             name='Speculation Index', 
@@ -279,7 +334,7 @@ if True:  # Using True to always enter the block (could be removed for clarity)
         ))
 
         # Plot BTC on the secondary y-axis
-        fig2.add_trace(go.Scatter(
+        fig2.add_trace(decimated_scatter(
             x=dates, y=btc, 
             mode='lines', 
             name='BTC', 
@@ -324,7 +379,8 @@ if True:  # Using True to always enter the block (could be removed for clarity)
         )
 
         # Display the interactive plot in Streamlit
-        st.plotly_chart(fig2, use_container_width=True)
+        with stage("render_chart", chart="speculation"):
+            st.plotly_chart(fig2, use_container_width=True)
 
     except Exception as e:
         # Handle any errors that occur during data fetching or processing
@@ -332,42 +388,37 @@ if True:  # Using True to always enter the block (could be removed for clarity)
 
 st.write("---")
 
-# Prepare data for CSV download
-if not (option == "RSI"):
-    df = pd.DataFrame({
-        "Date": dates,  # Date column
-        "BTC Price": btc,  # BTC price column
-        "50 SMA": sma50,  # 50-period SMA column
-        "200 SMA": sma200,  # 200-period SMA column
-        "50 EMA": ema50,  # 50-period EMA column
-        "200 EMA": ema200,  # 200-period EMA column
-        "50 RSI": rsi50,  # 50-period RSI column
-        "SMA Dif": sma_ratio,
-        "EMA Dif": ema_ratio
-})
-
-elif (option == "RSI"):
-    df = pd.DataFrame({
-        "Date": dates,  # Date column
-        "BTC Price": btc,  # BTC price column
-        "50 SMA": sma50,  # 50-period SMA column
-        "200 SMA": sma200,  # 200-period SMA column
-        "50 EMA": ema50,  # 50-period EMA column
-        "200 EMA": ema200,  # 200-period EMA column
-        "50 RSI": rsi50,  # 50-period RSI column
-})
-
-# Provide the option to download the data as a CSV file
-csv = df.to_csv(index=False)  # Convert DataFrame to CSV format without index
+# Prepare the export table straight from the dataset, independent of the charts above
+def export_frame():
+    columns = {
+        "Date": data["date"],  # Date column
+        "BTC Price": data["btc"],  # BTC price column
+        "50 SMA": data["50sma"],  # 50-period SMA column
+        "200 SMA": data["200sma"],  # 200-period SMA column
+        "50 EMA": data["50ema"],  # 50-period EMA column
+        "200 EMA": data["200ema"],  # 200-period EMA column
+        "50 RSI": data["50rsi"],  # 50-period RSI column
+    }
+    if not (option == "RSI"):
+        columns["SMA Dif"] = data["sma_spread"]
+        columns["EMA Dif"] = data["ema_spread"]
+    return pd.DataFrame(columns)
 
 # Create columns for the download button layout
 col2_1, col2_2, col2_3 = st.columns([3, 1, 3])
 
-# Place the download button in the center column
+# Place the format picker and download button in the center column
 with col2_2:
+    export_format = st.selectbox("Export format", options=list(FORMATS))
     st.download_button(
-        label="Download data as CSV",  # Button label
-        data=csv,  # Data to download
-        file_name='crypto_data.csv',  # Name of the downloaded file
-        mime='text/csv',  # MIME type for CSV
+        label=f"Download data as {export_format}",  # Button label
+        # Serialized only when clicked, then kept on the dataset for this data version
+        data=deferred_export(export_frame, export_format, dataset=data, key="rsi" if option == "RSI" else "all"),
+        file_name=file_name("crypto_data", export_format),  # Name of the downloaded file
+        mime=mime_type(export_format),  # MIME type of the format
     )
+
+if diagnostics.enabled():
+    with st.expander("Diagnostics"):
+        st.dataframe(pd.DataFrame(diagnostics.records()), hide_index=True)
+        st.dataframe(pd.DataFrame([shared_cache.stats()]), hide_index=True)
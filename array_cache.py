@@ -0,0 +1,168 @@
+"""Process-wide, memory-bounded cache for immutable array results.
+
+st.cache_data pickles every return value, hands each hit a freshly unpickled copy and keeps one
+entry per argument combination until its TTL runs out. ArrayCache keeps results as read-only
+NumPy arrays shared by every session (as st.cache_resource does) within a byte budget, evicting
+the least recently used entries first, and counts hits, misses and evictions.
+
+    @cached_stage("calculate_equities", cached_arrays(ttl=600))
+    def calculate_equities(...): ...
+
+TRW_ARRAY_CACHE_MB sets the budget of the shared cache (256 MB by default).
+"""
+import functools
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MAX_BYTES = int(float(os.environ.get("TRW_ARRAY_CACHE_MB", "256")) * 2 ** 20)
+
+_MISSING = object()
+
+
+def _freeze(value, dtype=None):
+    """value with every array contiguous and read-only (floating arrays cast to dtype), and its size in bytes.
+
+    Arrays may sit in tuples, lists and dicts; pandas objects are kept as they are.
+    """
+    if isinstance(value, np.ndarray):
+        if dtype is not None and np.issubdtype(value.dtype, np.floating):
+            value = value.astype(dtype)
+        value = np.ascontiguousarray(value)
+        value.flags.writeable = False
+        return value, value.nbytes
+    if isinstance(value, (tuple, list)):
+        frozen = [_freeze(item, dtype) for item in value]
+        return tuple(item for item, _ in frozen), sum(size for _, size in frozen)
+    if isinstance(value, dict):
+        frozen = {key: _freeze(item, dtype) for key, item in value.items()}
+        return {key: item for key, (item, _) in frozen.items()}, sum(size for _, size in frozen.values())
+    if isinstance(value, pd.DataFrame):
+        return value, int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return value, int(value.memory_usage(deep=True))
+    return value, sys.getsizeof(value)
+
+
+def _hash_into(digest, value):
+    """Feed value into digest; arrays and pandas objects by their dtype, shape and raw bytes."""
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.to_numpy()
+    if isinstance(value, pd.DataFrame):
+        _hash_into(digest, list(value.columns))
+        value = [value[column].to_numpy() for column in value.columns]
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        if value.dtype == object:
+            digest.update(repr(value.tolist()).encode())
+        else:
+            digest.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (tuple, list)):
+        digest.update(b"(")
+        for item in value:
+            _hash_into(digest, item)
+        digest.update(b")")
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key in sorted(value, key=repr):
+            _hash_into(digest, key)
+            _hash_into(digest, value[key])
+        digest.update(b"}")
+    else:
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+def arguments_key(*args, **kwargs):
+    """Hash of call arguments, arrays included by content."""
+    digest = hashlib.blake2b(digest_size=16)
+    _hash_into(digest, (args, kwargs))
+    return digest.hexdigest()
+
+
+class ArrayCache:
+    """LRU cache of frozen results bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # Key -> (value, size in bytes, expiry time or None)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl=None, dtype=None):
+        """Store a frozen copy of value and return it; a value larger than the whole budget is returned without being stored."""
+        value, size = _freeze(value, dtype)
+        if size > self.max_bytes:
+            return value
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def clear(self, prefix=None):
+        """Drop every entry, or only those whose key starts with prefix."""
+        with self._lock:
+            for key in [key for key in self._entries if prefix is None or key[0] == prefix]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+shared_cache = ArrayCache()
+
+
+def cached_arrays(ttl=None, dtype=None, cache=None):
+    """Decorator caching a function's results in an ArrayCache (the shared one by default).
+
+    Arguments are keyed by content, so NumPy arrays and pandas objects can be passed. Results are
+    returned frozen and shared: arrays are read-only and the same objects are handed to every
+    caller. With dtype, floating arrays are stored in that dtype (e.g. float32 for series that
+    are only plotted).
+    """
+    def decorate(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            store = cache if cache is not None else shared_cache
+            key = (name, arguments_key(*args, **kwargs))
+            value = store.get(key, _MISSING)
+            if value is _MISSING:
+                value = store.put(key, function(*args, **kwargs), ttl=ttl, dtype=dtype)
+            return value
+
+        call.clear = lambda: (cache if cache is not None else shared_cache).clear(name)
+        return call
+    return decorate
@@ -0,0 +1,642 @@
+"""TPI backtest engine: equity curves, performance metrics, threshold sweeps and walk-forward analysis.
+
+Everything here works on plain NumPy arrays with no Streamlit dependency, so it is shared by the
+TPI Backtest page and the batch grading command line:
+
+    python backtest.py submissions/ --returns returns.csv --column btc --long 0 --short 0 --output metrics.csv
+
+TPIs are paired with returns by date (see align_tpi), not by row position.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from drawdowns import drawdown_statistics_batch
+from trades import trade_statistics_batch
+
+
+def tpi_positions(tpi_data, long_threshold, short_threshold):
+    """Map TPI values to positions: 1 (long), -1 (short) or 0 (neutral/cash)."""
+    tpi = np.asarray(tpi_data, dtype=float)
+    # Long takes precedence over short when the thresholds overlap
+    return np.where(tpi > long_threshold, 1, np.where(tpi < short_threshold, -1, 0)).astype(np.int8)
+
+
+def tpi_exposure(tpi_data, long_threshold, short_threshold, sizing="threshold", max_leverage=1.0):
+    """Map TPI values to exposures, capped at max_leverage in either direction.
+
+    "threshold" sizing holds a full +/-max_leverage position outside the neutral band, like
+    tpi_positions. "proportional" sizing keeps the side tpi_positions picks and scales its size
+    with the TPI's magnitude (capped at 1), so a long at a TPI of 0.5 (or -0.5) holds half the
+    maximum exposure.
+    """
+    positions = tpi_positions(tpi_data, long_threshold, short_threshold)
+    if sizing == "threshold":
+        return positions * float(max_leverage)
+    if sizing == "proportional":
+        tpi = np.asarray(tpi_data, dtype=float)
+        # A missing TPI value is neutral, as with threshold sizing
+        return positions * np.clip(np.abs(np.nan_to_num(tpi)), 0, 1) * float(max_leverage)
+    raise ValueError(f"Unknown position sizing: {sizing}")
+
+
+def position_growth(daily_returns, exposure, fee=0.0, slippage=0.0):
+    """Per-bar growth factors of an exposure series, or a 2D batch of them (curves x bars).
+
+    fee and slippage are fractions of the traded notional, charged whenever the exposure changes
+    (entering from cash at the first bar included). Without costs a bar's growth is exactly
+    1 + exposure * return.
+    """
+    returns = np.asarray(daily_returns, dtype=float)
+    exposure = np.asarray(exposure, dtype=float)
+    growth = 1 + exposure * returns
+
+    cost = fee + slippage
+    if cost:
+        turnover = np.abs(np.diff(exposure, axis=-1, prepend=0.0))
+        growth *= 1 - cost * turnover
+    return growth
+
+
+def position_equity(daily_returns, exposure, fee=0.0, slippage=0.0):
+    """Equity curves starting at 1 from position_growth()."""
+    growth = position_growth(daily_returns, exposure, fee=fee, slippage=slippage)
+    equity = np.ones(growth.shape[:-1] + (growth.shape[-1] + 1,))
+    np.cumprod(growth, axis=-1, out=equity[..., 1:])
+    return equity
+
+
+def calculate_equities(daily_returns, tpi_data, long_threshold, short_threshold, fee=0.0, slippage=0.0,
+                       sizing="threshold", max_leverage=1.0):
+    """Calculate strategy and buy-and-hold equities based on daily returns and TPI signals.
+
+    Returns three arrays of length len(tpi_data) + 1 starting at 1. The three curves are
+    position_equity() of the strategy exposure, a constant exposure of 1 and the long side of
+    the strategy exposure; the defaults give the plain long/short/cash backtest without costs.
+    """
+    exposure = tpi_exposure(tpi_data, long_threshold, short_threshold, sizing, max_leverage)
+    returns = np.asarray(daily_returns, dtype=float)[:len(exposure)]
+    n = len(returns)
+
+    exposures = np.vstack([exposure[:n], np.ones(n), np.maximum(exposure[:n], 0)])
+    curves = np.ones((3, len(exposure) + 1))
+    curves[:, :n + 1] = position_equity(returns, exposures, fee=fee, slippage=slippage)
+    strategy_equity, buy_and_hold_equity, long_only_equity = curves
+
+    # If daily returns data is shorter than tpi data, strategy and buy-and-hold stay flat
+    # and long-only takes the last buy-and-hold value
+    strategy_equity[n + 1:] = strategy_equity[n]
+    buy_and_hold_equity[n + 1:] = buy_and_hold_equity[n]
+    long_only_equity[n + 1:] = buy_and_hold_equity[n]
+
+    return strategy_equity, buy_and_hold_equity, long_only_equity
+
+def _masked_mean_std(values, mask):
+    """Row-wise mean and standard deviation of the masked values, 0 for rows with no masked values."""
+    count = mask.sum(axis=1)
+    safe_count = np.maximum(count, 1)
+    mean = np.where(mask, values, 0).sum(axis=1) / safe_count
+    std = np.sqrt(np.where(mask, (values - mean[:, None]) ** 2, 0).sum(axis=1) / safe_count)
+    return mean, std, count
+
+
+def calculate_metrics_batch(indexed_equities, benchmark_equity=None, risk_free_rate=0.0):
+    """Calculate the calculate_metrics dict for a stacked 2D array of curves (N curves x T bars).
+
+    benchmark_equity is either one curve shared by all rows or an N x T array with one benchmark
+    per row. Every metric is an array of length N. Intermediates (returns, masks, running peaks and
+    the benchmark returns) are computed once and shared across all curves.
+    """
+    equity = np.atleast_2d(np.asarray(indexed_equities, dtype=float))
+    daily_returns = np.diff(equity, axis=1) / equity[:, :-1]
+    n_bars = daily_returns.shape[1]
+
+    # Positive and negative returns
+    positive = daily_returns > 0
+    negative = daily_returns < 0
+    mean_positive, std_positive, _ = _masked_mean_std(daily_returns, positive)
+    mean_negative, std_negative, negative_count = _masked_mean_std(daily_returns, negative)
+
+    # Mean and standard deviation of daily returns
+    mean_return = daily_returns.mean(axis=1)
+    centered = daily_returns - mean_return[:, None]
+    squared = centered * centered
+    variance = squared.mean(axis=1)
+    std_dev = np.sqrt(variance)
+    sortino_denominator = np.where(negative_count > 0, std_negative, 1)
+
+    # Annualization factor (252 trading days assumed)
+    trading_days_per_year = 252
+    annualized_mean = mean_return * trading_days_per_year
+    annualized_std_dev = std_dev * np.sqrt(trading_days_per_year)
+    annualized_sortino_denominator = sortino_denominator * np.sqrt(trading_days_per_year)
+
+    # Max drawdown from the peak in effect at each bar, its longest duration and time under water
+    drawdowns = drawdown_statistics_batch(equity)
+    max_drawdown = drawdowns["Max Drawdown"]
+
+    # Omega Ratio
+    gains = np.where(positive, daily_returns, 0).sum(axis=1)
+    losses = -np.where(negative, daily_returns, 0).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Sharpe and Sortino Ratios (annualized)
+        sharpe_ratio = np.where(annualized_std_dev != 0, (annualized_mean - risk_free_rate) / annualized_std_dev, np.nan)
+        sortino_ratio = np.where(annualized_sortino_denominator != 0, (annualized_mean - risk_free_rate) / annualized_sortino_denominator, np.nan)
+        omega_ratio = np.where(losses != 0, gains / losses, np.nan)
+
+        # Alpha, Beta and excess return against the benchmark
+        if benchmark_equity is not None:
+            benchmark = np.atleast_2d(np.asarray(benchmark_equity, dtype=float))
+            benchmark_returns = np.diff(benchmark, axis=1) / benchmark[:, :-1]
+            benchmark_mean = benchmark_returns.mean(axis=1)
+            benchmark_variance = benchmark_returns.var(axis=1)
+            annualized_benchmark_mean = benchmark_mean * trading_days_per_year
+
+            # Sample covariance, as np.cov
+            covariance = (centered * (benchmark_returns - benchmark_mean[:, None])).sum(axis=1) / (n_bars - 1)
+            beta = np.where(benchmark_variance != 0, covariance / benchmark_variance, np.nan)
+            alpha = (annualized_mean - risk_free_rate) - (beta * (annualized_benchmark_mean - risk_free_rate))
+
+            excess_return = annualized_mean - annualized_benchmark_mean
+            tracking_error = np.std(daily_returns - benchmark_returns, axis=1) * np.sqrt(trading_days_per_year)
+            information_ratio = np.where(tracking_error != 0, excess_return / tracking_error, np.nan)
+        else:
+            alpha = beta = excess_return = tracking_error = information_ratio = np.full(len(equity), np.nan)
+
+        # Calmar Ratio
+        calmar_ratio = np.where(max_drawdown != 0, annualized_mean / max_drawdown, np.nan)
+
+        # Skewness and excess kurtosis from the central moments, as scipy.stats (NaN for constant returns)
+        constant = variance <= (np.finfo(float).eps * mean_return) ** 2
+        skewness = np.where(constant, np.nan, (squared * centered).mean(axis=1) / variance ** 1.5)
+        excess_kurtosis = np.where(constant, np.nan, (squared * squared).mean(axis=1) / variance ** 2 - 3)
+
+    # CAGR
+    cagr = (equity[:, -1] / equity[:, 0]) ** (trading_days_per_year / n_bars) - 1
+
+    metrics = {
+        "Sharpe Ratio": sharpe_ratio,
+        "Sortino Ratio": sortino_ratio,
+        "Omega Ratio": omega_ratio,
+        "Alpha": alpha,
+        "Beta": beta,
+        "Information Ratio": information_ratio,
+        "Calmar Ratio": calmar_ratio,
+        "Excess Return (Alpha)": excess_return,
+        "Tracking Error": tracking_error,
+        "Mean Return (Daily)": mean_return,
+        "Standard Deviation (Daily)": std_dev,
+        "Skewness": skewness,
+        "Excess Kurtosis": excess_kurtosis,
+        "Max Drawdown": max_drawdown,
+        "Max Drawdown Duration": drawdowns["Max Drawdown Duration"],
+        "Time Under Water": drawdowns["Time Under Water"],
+        "CAGR (Annualized Return)": cagr,
+        "Mean Positive Return (Daily)": mean_positive,
+        "Standard Deviation Positive Returns (Daily)": std_positive,
+        "Mean Negative Return (Daily)": mean_negative,
+        "Standard Deviation Negative Returns (Daily)": std_negative,
+    }
+
+    return metrics
+
+
+def calculate_metrics(indexed_equity, benchmark_equity=None, risk_free_rate=0.0):
+    """Calculate the performance metrics of a single equity curve."""
+    metrics = calculate_metrics_batch(np.asarray(indexed_equity, dtype=float)[None, :], benchmark_equity, risk_free_rate)
+    return {name: values[0] for name, values in metrics.items()}
+
+
+def _window_sums(values, window):
+    """Sum of every trailing window of `window` values, from the running (prefix) sum."""
+    running = np.concatenate(([0.0], np.cumsum(values)))
+    return running[window:] - running[:-window]
+
+
+def _rolling_max_drawdown(equity, points):
+    """Max drawdown (as in calculate_metrics) of every window of `points` consecutive equity values.
+
+    Uses a doubling table of (peak, trough, lowest trough-to-peak ratio) per power-of-two block, so
+    each window is merged from O(log points) blocks instead of rescanning every bar.
+    """
+    highs, lows, ratios = [equity], [equity], [np.ones(len(equity))]
+    size = 1
+    while size * 2 <= points:
+        h, l, r = highs[-1], lows[-1], ratios[-1]
+        count = len(h) - size
+        highs.append(np.maximum(h[:count], h[size:]))
+        lows.append(np.minimum(l[:count], l[size:]))
+        ratios.append(np.minimum(np.minimum(r[:count], r[size:]), l[size:] / h[:count]))
+        size *= 2
+
+    starts = np.arange(len(equity) - points + 1)
+    peak = trough = ratio = None
+    for level in range(len(highs) - 1, -1, -1):
+        if not points & (1 << level):
+            continue
+        h, l, r = highs[level][starts], lows[level][starts], ratios[level][starts]
+        if peak is None:
+            peak, trough, ratio = h, l, r
+        else:
+            # The left part's peak can precede the right part's trough
+            ratio = np.minimum(np.minimum(ratio, r), l / peak)
+            peak = np.maximum(peak, h)
+            trough = np.minimum(trough, l)
+        starts = starts + (1 << level)
+
+    return 1 - ratio
+
+
+def calculate_rolling_metrics(indexed_equity, window, benchmark_equity=None, risk_free_rate=0.0):
+    """Rolling Sharpe, Sortino, Beta and Max Drawdown over the last `window` returns.
+
+    Running sums of the returns and their moments are differenced as the window slides, so the
+    cost is O(T) regardless of the window size. Each value matches calculate_metrics on
+    indexed_equity[i - window:i + 1]; the arrays are aligned with indexed_equity and NaN until a
+    full window is available.
+    """
+    equity = np.asarray(indexed_equity, dtype=float)
+    rolling = {name: np.full(len(equity), np.nan) for name in ("Sharpe Ratio", "Sortino Ratio", "Beta", "Max Drawdown")}
+    if len(equity) <= window:
+        return rolling
+
+    daily_returns = np.diff(equity) / equity[:-1]
+    trading_days_per_year = 252
+
+    # Shift by the overall mean before accumulating to limit cancellation in the moments
+    shift = daily_returns.mean()
+    centered = daily_returns - shift
+    window_sum = _window_sums(centered, window)
+    mean_return = window_sum / window + shift
+    variance = np.maximum(_window_sums(centered ** 2, window) / window - (window_sum / window) ** 2, 0)
+
+    # Windows where the curve stays flat (e.g. neutral/cash) are exactly zero, not rounding noise
+    flat = _window_sums((daily_returns != 0).astype(float), window) == 0
+    mean_return[flat] = 0
+    variance[flat] = 0
+    annualized_mean = mean_return * trading_days_per_year
+    annualized_std_dev = np.sqrt(variance) * np.sqrt(trading_days_per_year)
+
+    # Moments of the negative returns only
+    negative = daily_returns < 0
+    negative_centered = np.where(negative, centered, 0)
+    negative_count = _window_sums(negative.astype(float), window)
+    safe_count = np.maximum(negative_count, 1)
+    negative_variance = np.maximum(
+        _window_sums(negative_centered ** 2, window) / safe_count - (_window_sums(negative_centered, window) / safe_count) ** 2, 0
+    )
+    negative_variance[negative_count < 2] = 0  # Exact for a lone negative return
+    sortino_denominator = np.where(negative_count > 0, np.sqrt(negative_variance), 1) * np.sqrt(trading_days_per_year)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rolling["Sharpe Ratio"][window:] = np.where(annualized_std_dev != 0, (annualized_mean - risk_free_rate) / annualized_std_dev, np.nan)
+        rolling["Sortino Ratio"][window:] = np.where(sortino_denominator != 0, (annualized_mean - risk_free_rate) / sortino_denominator, np.nan)
+
+        if benchmark_equity is not None:
+            benchmark = np.asarray(benchmark_equity, dtype=float)
+            benchmark_returns = np.diff(benchmark) / benchmark[:-1]
+            benchmark_centered = benchmark_returns - benchmark_returns.mean()
+            benchmark_sum = _window_sums(benchmark_centered, window)
+            benchmark_variance = _window_sums(benchmark_centered ** 2, window) / window - (benchmark_sum / window) ** 2
+
+            # Sample covariance over population benchmark variance, as calculate_metrics
+            covariance = (_window_sums(centered * benchmark_centered, window) - window_sum * benchmark_sum / window) / (window - 1)
+            covariance[flat] = 0
+            rolling["Beta"][window:] = np.where(benchmark_variance > 0, covariance / benchmark_variance, np.nan)
+
+    rolling["Max Drawdown"][window:] = _rolling_max_drawdown(equity, window + 1)
+
+    return rolling
+
+
+def walk_forward(daily_returns, tpi_data, long_thresholds, short_thresholds, in_sample, out_of_sample, metric="Sharpe Ratio",
+                 **position_options):
+    """Fit thresholds on each in-sample window with sweep_thresholds and score them on the following out-of-sample window.
+
+    Windows roll forward by out_of_sample bars. Returns a DataFrame with one row per split and the
+    out-of-sample strategy equity stitched across splits. position_options (costs, sizing,
+    leverage) apply to both the fit and the out-of-sample backtest.
+    """
+    tpi = np.asarray(tpi_data, dtype=float)
+    returns = np.asarray(daily_returns, dtype=float)[:len(tpi)]
+
+    splits = []
+    oos_growth = []
+    for start in range(0, len(returns) - in_sample - out_of_sample + 1, out_of_sample):
+        fit_end = start + in_sample
+        test_end = fit_end + out_of_sample
+
+        # Best threshold pair in-sample
+        fit = sweep_thresholds(returns[start:fit_end], tpi[start:fit_end], long_thresholds, short_thresholds, **position_options)
+        scores = np.where(np.isnan(fit[metric]), -np.inf, fit[metric])
+        best_long, best_short = np.unravel_index(np.argmax(scores), scores.shape)
+
+        # Score the chosen pair on the unseen window
+        strategy_equity, buy_and_hold_equity, _ = calculate_equities(
+            returns[fit_end:test_end], tpi[fit_end:test_end], long_thresholds[best_long], short_thresholds[best_short],
+            **position_options
+        )
+        oos_metrics = calculate_metrics(strategy_equity, benchmark_equity=buy_and_hold_equity)
+        oos_growth.append(strategy_equity[1:] / strategy_equity[:-1])
+
+        splits.append({
+            "In-Sample Start": start,
+            "Out-of-Sample Start": fit_end,
+            "Out-of-Sample End": test_end,
+            "Long Threshold": long_thresholds[best_long],
+            "Short Threshold": short_thresholds[best_short],
+            f"In-Sample {metric}": fit[metric][best_long, best_short],
+            f"Out-of-Sample {metric}": oos_metrics[metric],
+            "Out-of-Sample Max Drawdown": oos_metrics["Max Drawdown"],
+        })
+
+    oos_equity = np.concatenate(([1.0], np.cumprod(np.concatenate(oos_growth)))) if oos_growth else np.ones(1)
+    return pd.DataFrame(splits), oos_equity
+
+
+def sweep_thresholds(daily_returns, tpi_data, long_thresholds, short_thresholds, chunk_size=512, fee=0.0, slippage=0.0,
+                     sizing="threshold", max_leverage=1.0):
+    """Evaluate the strategy for every (long, short) threshold pair as one 2D batch.
+
+    Returns a dict of metric name -> array shaped (len(long_thresholds), len(short_thresholds)),
+    trade statistics included. Pairs are processed in chunks of chunk_size rows to bound memory. Costs, sizing and leverage
+    work as in calculate_equities.
+    """
+    tpi = np.asarray(tpi_data, dtype=float)
+    returns = np.zeros(len(tpi))  # Bars past the end of the returns stay flat
+    available = np.asarray(daily_returns, dtype=float)[:len(tpi)]
+    returns[:len(available)] = available
+    buy_and_hold_equity = np.concatenate(([1.0], np.cumprod(1 + returns)))
+
+    long_grid, short_grid = np.meshgrid(long_thresholds, short_thresholds, indexing='ij')
+    long_flat = long_grid.ravel()
+    short_flat = short_grid.ravel()
+
+    results = {}
+    for start in range(0, len(long_flat), chunk_size):
+        stop = start + chunk_size
+        positions = tpi_exposure(tpi, long_flat[start:stop, None], short_flat[start:stop, None], sizing, max_leverage)
+
+        equity = position_equity(returns, positions, fee=fee, slippage=slippage)
+
+        metrics = calculate_metrics_batch(equity, benchmark_equity=buy_and_hold_equity)
+        metrics.update(trade_statistics_batch(tpi_positions(tpi, long_flat[start:stop, None], short_flat[start:stop, None]), equity))
+        for name, values in metrics.items():
+            results.setdefault(name, np.empty(len(long_flat)))[start:stop] = values
+
+    return {name: values.reshape(long_grid.shape) for name, values in results.items()}
+
+
+def backtest_all_assets(returns_by_asset, tpi_data, long_threshold, short_threshold, **position_options):
+    """Backtest one TPI on every asset and score all curves with a single calculate_metrics_batch call.
+
+    Returns a metrics table (metrics x assets, for the strategy) and a dict of asset ->
+    (strategy, buy-and-hold, long-only) equities. position_options (costs, sizing, leverage)
+    are passed to calculate_equities.
+    """
+    equities = {
+        asset: calculate_equities(returns, tpi_data, long_threshold, short_threshold, **position_options)
+        for asset, returns in returns_by_asset.items()
+    }
+
+    # Strategy curves scored against each asset's own buy-and-hold
+    strategy = np.vstack([curves[0] for curves in equities.values()])
+    buy_and_hold = np.vstack([curves[1] for curves in equities.values()])
+    metrics = calculate_metrics_batch(strategy, benchmark_equity=buy_and_hold)
+
+    table = pd.DataFrame(metrics, index=list(equities)).T
+    return table, equities
+
+
+### ALIGNMENT ###
+
+def read_tpi_csv(source, chunksize=100_000, columns=("tpi",)):
+    """Read the 'date' and TPI columns of an uploaded CSV in chunks.
+
+    Only 'date' and the given columns (every column with columns=None, e.g. for a wide CSV with
+    one TPI per column) are kept, parsed to datetime64 and float64 one chunk at a time, so a
+    large upload never sits in memory as a frame of strings. A missing column is simply absent
+    from the result.
+    """
+    parts = []
+    for chunk in pd.read_csv(source, usecols=lambda name: name == "date" or columns is None or name in columns, chunksize=chunksize):
+        for name in chunk.columns:
+            if name == "date":
+                chunk["date"] = pd.to_datetime(chunk["date"], errors="coerce")
+            else:
+                chunk[name] = pd.to_numeric(chunk[name], errors="coerce").astype("float64")
+        parts.append(chunk)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+@dataclass(frozen=True)
+class Alignment:
+    """A TPI aligned to the dates of a return series.
+
+    The TPI covers return rows start:stop, one value per return date. duplicates lists the TPI
+    dates that appeared more than once (the last row wins), gaps the return dates the TPI
+    skipped (filled with the previous TPI value) and unmatched the TPI dates with no return.
+    """
+    dates: np.ndarray
+    tpi: np.ndarray
+    start: int
+    stop: int
+    duplicates: np.ndarray
+    gaps: np.ndarray
+    unmatched: np.ndarray
+
+    def issues(self):
+        """Short descriptions of everything that was repaired during alignment."""
+        found = []
+        for values, label in [(self.duplicates, "duplicated TPI dates (last value kept)"),
+                              (self.gaps, "missing TPI dates (previous value carried forward)"),
+                              (self.unmatched, "TPI dates without return data (dropped)")]:
+            if len(values):
+                shown = ", ".join(np.datetime_as_string(values[:5], unit="D"))
+                found.append(f"{len(values)} {label}: {shown}{', ...' if len(values) > 5 else ''}")
+        return found
+
+
+def _naive_dates(dates):
+    """Dates as a DatetimeIndex without timezone, timezone-aware dates converted to UTC."""
+    index = pd.DatetimeIndex(dates)
+    return index.tz_convert(None) if index.tz is not None else index
+
+
+def _calendar_days(dates):
+    """Dates as datetime64[D] calendar days, timezone-aware dates taken in UTC."""
+    return _naive_dates(dates).to_numpy(dtype="datetime64[D]")
+
+
+def align_tpi(tpi_dates, tpi_values, return_dates):
+    """Align a TPI to the sorted dates of a return series with a backward as-of join.
+
+    Dates are matched by calendar day, so a sheet date carrying a time of day (e.g.
+    T05:00:00Z) matches a plain YYYY-MM-DD TPI date. Every return date from the first to the
+    last TPI date gets the TPI value in effect on that day. Runs in O(n log n) with sorting and
+    searchsorted, without a per-row loop.
+    """
+    if len(return_dates) == 0:
+        raise ValueError("The return data has no dates to align the TPI to.")
+    tpi_days = _calendar_days(tpi_dates)
+    tpi_values = np.asarray(tpi_values, dtype="float64")
+    return_dates = _naive_dates(return_dates).to_numpy(dtype="datetime64[ns]")
+    return_days = return_dates.astype("datetime64[D]")
+
+    valid = ~np.isnat(tpi_days)
+    order = np.argsort(tpi_days[valid], kind="stable")
+    dates, values = tpi_days[valid][order], tpi_values[valid][order]
+    if len(dates) == 0:
+        raise ValueError("The TPI file has no parseable dates.")
+
+    # Keep the last row of each date, as a later row in the file is a correction
+    last = np.append(dates[1:] != dates[:-1], True)
+    duplicates = np.unique(dates[~last])
+    dates, values = dates[last], values[last]
+
+    found = np.searchsorted(return_days, dates).clip(max=len(return_days) - 1)
+    unmatched = dates[return_days[found] != dates]
+
+    start = int(np.searchsorted(return_days, dates[0], side="left"))
+    stop = int(np.searchsorted(return_days, dates[-1], side="right"))
+    if stop <= start:
+        raise ValueError("The TPI dates do not overlap the dates of the return data.")
+
+    span = return_days[start:stop]
+    position = np.searchsorted(dates, span, side="right") - 1
+    gaps = span[dates[position] != span]
+
+    return Alignment(dates=return_dates[start:stop], tpi=values[position], start=start, stop=stop,
+                     duplicates=duplicates, gaps=gaps, unmatched=unmatched)
+
+
+### BATCH GRADING ###
+
+_grading = {}  # Worker state set once per process by _init_grading
+
+
+def read_table(path):
+    """Read a CSV or Parquet file into a DataFrame."""
+    path = Path(path)
+    return pd.read_parquet(path) if path.suffix in (".parquet", ".pq") else pd.read_csv(path)
+
+
+def write_table(frame, path):
+    """Write a DataFrame as Parquet or CSV depending on the file suffix."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix in (".parquet", ".pq"):
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def load_returns(path, column=None):
+    """Daily returns from a CSV/Parquet file: the given column, or the only non-date column.
+
+    Returns (dates, returns). dates is None when the file has no 'date' column, in which case
+    TPIs are paired with the returns by row position.
+    """
+    frame = read_table(path)
+    if column is None:
+        candidates = [name for name in frame.columns if name != "date"]
+        if len(candidates) != 1:
+            raise ValueError(f"{path} has several return columns, choose one with --column: {candidates}")
+        column = candidates[0]
+    dates = _naive_dates(pd.to_datetime(frame["date"])).to_numpy(dtype="datetime64[ns]") if "date" in frame.columns else None
+    return dates, frame[column].to_numpy(dtype="float64")
+
+
+def _init_grading(return_dates, daily_returns, long_threshold, short_threshold, equity_dir):
+    _grading.update(dates=return_dates, returns=daily_returns, long=long_threshold, short=short_threshold, equity_dir=equity_dir)
+
+
+def grade_file(path):
+    """Backtest one 'date,tpi' CSV with the worker's returns and thresholds. Returns a metrics row."""
+    row = {"file": Path(path).name}
+    try:
+        submission = read_tpi_csv(path)
+        if "tpi" not in submission.columns or "date" not in submission.columns:
+            raise ValueError("the CSV file must contain both 'tpi' and 'date' columns")
+
+        returns, dates, tpi = _grading["returns"], submission["date"], submission["tpi"]
+        if _grading["dates"] is not None:
+            alignment = align_tpi(dates, tpi, _grading["dates"][:len(returns)])
+            returns, dates, tpi = returns[alignment.start:alignment.stop], alignment.dates, alignment.tpi
+            row["warnings"] = "; ".join(alignment.issues())
+
+        strategy_equity, buy_and_hold_equity, long_only_equity = calculate_equities(
+            returns, tpi, _grading["long"], _grading["short"]
+        )
+        metrics = calculate_metrics(strategy_equity, benchmark_equity=buy_and_hold_equity)
+        row.update(metrics)
+        row["error"] = ""
+
+        if _grading["equity_dir"] is not None:
+            curves = pd.DataFrame({
+                "date": dates,
+                "strategy": strategy_equity[1:],
+                "long_only": long_only_equity[1:],
+                "buy_and_hold": buy_and_hold_equity[1:],
+            })
+            write_table(curves, Path(_grading["equity_dir"]) / f"{Path(path).stem}.csv")
+    except Exception as e:
+        # One broken submission must not stop the whole cohort
+        row["error"] = str(e)
+    return row
+
+
+def grade_directory(tpi_dir, daily_returns, long_threshold, short_threshold, return_dates=None, equity_dir=None, workers=None):
+    """Grade every CSV in tpi_dir on a process pool. Returns one row of strategy metrics per file.
+
+    With return_dates each TPI is aligned to the returns by date, otherwise by row position.
+    """
+    paths = sorted(Path(tpi_dir).glob("*.csv"))
+    workers = workers or os.cpu_count() or 1
+    init_args = (return_dates, np.asarray(daily_returns, dtype="float64"), long_threshold, short_threshold, equity_dir)
+
+    if workers == 1:
+        _init_grading(*init_args)
+        rows = [grade_file(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_grading, initargs=init_args) as pool:
+            rows = list(pool.map(grade_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+    metrics = pd.DataFrame(rows, columns=None if rows else ["file", "error"])
+    trailing = [name for name in ("warnings", "error") if name in metrics.columns]
+    metrics[trailing] = metrics[trailing].fillna("")
+    return metrics[[name for name in metrics.columns if name not in trailing] + trailing]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest a directory of 'date,tpi' CSV files against a return series.")
+    parser.add_argument("tpi_dir", help="Directory of TPI CSV files with 'date' and 'tpi' columns")
+    parser.add_argument("--returns", required=True, help="CSV or Parquet file with the daily returns")
+    parser.add_argument("--column", help="Return column to use, e.g. btc (needed when the file has several)")
+    parser.add_argument("--long", type=float, default=0.0, help="Long threshold")
+    parser.add_argument("--short", type=float, default=0.0, help="Short threshold")
+    parser.add_argument("--output", default="metrics.csv", help="Metrics table, .csv or .parquet")
+    parser.add_argument("--equity-dir", help="Also write each file's equity curves to this directory")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    try:
+        return_dates, daily_returns = load_returns(args.returns, args.column)
+    except (KeyError, ValueError) as e:
+        parser.error(str(e))
+    metrics = grade_directory(args.tpi_dir, daily_returns, args.long, args.short, return_dates=return_dates,
+                              equity_dir=args.equity_dir, workers=args.workers)
+    write_table(metrics, args.output)
+
+    failed = (metrics["error"] != "").sum()
+    print(f"Graded {len(metrics)} files ({failed} failed) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
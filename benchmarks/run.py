@@ -0,0 +1,235 @@
+"""Timing benchmarks for the backtest and breadth hot paths on synthetic data.
+
+Each benchmark's best and median time is printed and appended to benchmarks/results.jsonl
+together with the git commit, so a run can be compared against an earlier commit:
+
+    python benchmarks/run.py                     # run everything and record the results
+    python benchmarks/run.py -k equities         # only benchmarks whose name contains 'equities'
+    python benchmarks/run.py --compare HEAD~1    # also compare with the results recorded for HEAD~1
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import backtest  # noqa: E402
+import breadth  # noqa: E402
+import data_sources  # noqa: E402
+import ensemble  # noqa: E402
+import exports  # noqa: E402
+import trades  # noqa: E402
+from sheet_cache import payload_to_frame  # noqa: E402
+
+RESULTS = Path(__file__).resolve().parent / "results.jsonl"
+REGRESSION_RATIO = 1.2  # Slower than this factor of the reference is flagged
+
+BENCHMARKS = {}  # Name -> setup function returning the callable to time
+
+
+def benchmark(name):
+    """Register a setup function under name. The setup builds the data and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def synthetic_backtest(bars, seed=0):
+    """Daily returns and a smooth TPI in [-1, 1] of the given length."""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.001, 0.03, bars)
+    tpi = np.sin(np.arange(bars) / 25 + rng.normal(0, 0.3, bars))
+    return returns, tpi
+
+
+def synthetic_panel(coins=195, days=3000, seed=0):
+    """Random-walk close prices, coins x days, with listings starting at different days."""
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.04, (coins, days)), axis=1))
+    listed = rng.integers(0, days // 2, coins)
+    closes[np.arange(days) < listed[:, None]] = np.nan
+    return closes
+
+
+for bars in (1_000, 10_000, 100_000):
+    @benchmark(f"equities[{bars}]")
+    def _(bars=bars):
+        returns, tpi = synthetic_backtest(bars)
+        return lambda: backtest.calculate_equities(returns, tpi, 0.0, 0.0)
+
+    @benchmark(f"equities_costs[{bars}]")
+    def _(bars=bars):
+        returns, tpi = synthetic_backtest(bars)
+        return lambda: backtest.calculate_equities(returns, tpi, 0.0, 0.0, fee=0.001, slippage=0.0005, sizing="proportional", max_leverage=2.0)
+
+    @benchmark(f"metrics[{bars}]")
+    def _(bars=bars):
+        returns, tpi = synthetic_backtest(bars)
+        strategy, buy_and_hold, _ = backtest.calculate_equities(returns, tpi, 0.0, 0.0)
+        return lambda: backtest.calculate_metrics(strategy, benchmark_equity=buy_and_hold)
+
+
+@benchmark("metrics_batch[1000x2000]")
+def _():
+    rng = np.random.default_rng(0)
+    equities = np.cumprod(1 + rng.normal(0.001, 0.03, (1000, 2000)), axis=1)
+    return lambda: backtest.calculate_metrics_batch(equities, benchmark_equity=equities[0])
+
+
+@benchmark("rolling_metrics[2000]")
+def _():
+    returns, tpi = synthetic_backtest(2000)
+    strategy, buy_and_hold, _ = backtest.calculate_equities(returns, tpi, 0.0, 0.0)
+    return lambda: backtest.calculate_rolling_metrics(strategy, 365, benchmark_equity=buy_and_hold)
+
+
+@benchmark("sweep[41x41x2000]")
+def _():
+    returns, tpi = synthetic_backtest(2000)
+    thresholds = np.round(np.arange(-1.0, 1.025, 0.05), 4)
+    return lambda: backtest.sweep_thresholds(returns, tpi, thresholds, thresholds)
+
+
+@benchmark("trade_ledger[100000]")
+def _():
+    returns, tpi = synthetic_backtest(100_000)
+    positions = backtest.tpi_positions(tpi, 0.0, 0.0)
+    strategy, _, _ = backtest.calculate_equities(returns, tpi, 0.0, 0.0)
+    return lambda: trades.trade_ledger(positions, strategy)
+
+
+@benchmark("trade_statistics_batch[1000x2000]")
+def _():
+    returns, tpi = synthetic_backtest(2000)
+    thresholds = np.linspace(-1, 1, 1000)[:, None]
+    positions = backtest.tpi_positions(tpi, thresholds, -thresholds)
+    equity = backtest.position_equity(returns, positions)
+    return lambda: trades.trade_statistics_batch(positions, equity)
+
+
+@benchmark("ensemble_search[24x2000]")
+def _():
+    returns, tpi = synthetic_backtest(2000)
+    rng = np.random.default_rng(0)
+    signals = np.clip(tpi + rng.normal(0, 0.5, (24, 2000)), -1, 1)
+    return lambda: ensemble.ensemble_search(returns, signals, 0.0, 0.0, seed=0)
+
+
+@benchmark("align[100000]")
+def _():
+    dates = pd.date_range("1800-01-01", periods=100_000).to_numpy()
+    rng = np.random.default_rng(0)
+    kept = np.sort(rng.choice(len(dates), 95_000, replace=False))
+    return lambda: backtest.align_tpi(dates[kept], rng.random(len(kept)), dates)
+
+
+@benchmark("breadth[195x3000]")
+def _():
+    closes = synthetic_panel()
+    return lambda: breadth.compute_breadth(closes)
+
+
+@benchmark("speculation[195x3000]")
+def _():
+    closes = synthetic_panel()
+    return lambda: breadth.speculation_index(closes, closes[0])
+
+
+@benchmark("parse_payload[3000]")
+def _():
+    # Apps Script serializes dates as ISO strings and numbers as JSON numbers
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2016-01-01", periods=3000).strftime("%Y-%m-%dT%H:%M:%S.000Z").tolist()
+    payload = {"date": dates, **{name: rng.random(3000).tolist() for name in ("50sma", "200sma", "50ema", "200ema", "50rsi", "btc", "spec")}}
+    text = json.dumps(payload)
+    return lambda: payload_to_frame(json.loads(text))
+
+
+@benchmark("load_arrow[3000]")
+def _():
+    # Memory-mapped sheet file of the file data source
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({"date": pd.date_range("2016-01-01", periods=3000), **{name: rng.random(3000) for name in ("50sma", "200sma", "50ema", "200ema", "50rsi", "btc", "spec")}})
+    path = Path(tempfile.mkdtemp()) / "API_DATA.arrow"
+    data_sources.write_arrow(frame, path)
+    return lambda: data_sources._mapped_dataset(path, trim=False)
+
+
+for format_name in exports.FORMATS:
+    @benchmark(f"export[{format_name},3000]")
+    def _(format_name=format_name):
+        rng = np.random.default_rng(0)
+        frame = pd.DataFrame({"Date": pd.date_range("2016-01-01", periods=3000), **{name: rng.random(3000) for name in ("BTC Price", "SMA Ratio", "EMA Ratio", "Spec")}})
+        return lambda: exports.export_bytes(frame, format_name)
+
+
+def measure(function, min_time=0.5, min_repeats=3, max_repeats=50):
+    """Best and median seconds per call, repeating until about min_time has been spent."""
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_repeats and (len(times) < min_repeats or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), len(times)
+
+
+def git_commit(ref="HEAD"):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", ref], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def recorded(commit):
+    """Latest recorded best time of each benchmark for a commit."""
+    best = {}
+    if commit is not None and RESULTS.exists():
+        for line in RESULTS.read_text().splitlines():
+            entry = json.loads(line)
+            if entry["commit"] == commit:
+                best[entry["name"]] = entry["best"]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the timing benchmarks and record the results.")
+    parser.add_argument("-k", dest="pattern", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--compare", metavar="REF", help="Compare with the results recorded for this git commit")
+    parser.add_argument("--no-record", action="store_true", help="Do not append the results to results.jsonl")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    reference = recorded(git_commit(args.compare)) if args.compare else {}
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    entries = []
+    for name, setup in BENCHMARKS.items():
+        if args.pattern not in name:
+            continue
+        best, median, repeats = measure(setup())
+        line = f"{name:<28} best {best * 1000:10.3f} ms   median {median * 1000:10.3f} ms   ({repeats} runs)"
+        if name in reference:
+            ratio = best / reference[name]
+            line += f"   x{ratio:.2f} vs {args.compare}" + ("   SLOWER" if ratio > REGRESSION_RATIO else "")
+        print(line)
+        entries.append({"commit": commit, "time": now, "name": name, "best": best, "median": median, "repeats": repeats})
+
+    if not args.no_record:
+        with RESULTS.open("a") as results:
+            results.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Local Crypto Breadth engine computed from a coins x dates close-price panel.
+
+All indicators are evaluated for every coin at once on 2D arrays (coins along axis 0, dates along
+axis 1). Coins that listed late have leading NaN closes and are left out of a day's breadth until
+their indicator has a full window of history.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+
+def load_price_panel(path):
+    """Load a close-price panel from a CSV or Parquet file.
+
+    Accepts a wide file (a 'date' column plus one column per coin) or a long file with 'date',
+    'coin' and 'close' columns. Returns (dates, coins, closes) with closes shaped coins x dates.
+    """
+    path = Path(path)
+    frame = pd.read_parquet(path) if path.suffix in (".parquet", ".pq") else pd.read_csv(path)
+    frame["date"] = pd.to_datetime(frame["date"])
+
+    if {"coin", "close"}.issubset(frame.columns):
+        frame = frame.pivot_table(index="date", columns="coin", values="close", aggfunc="last")
+    else:
+        frame = frame.set_index("date")
+    frame = frame.sort_index()
+
+    closes = frame.to_numpy(dtype="float64").T
+    return frame.index.to_numpy(dtype="datetime64[ns]"), [str(coin) for coin in frame.columns], closes
+
+
+def last_valid_index(closes):
+    """Index of each coin's last valid close, -1 for a coin without any."""
+    valid = ~np.isnan(closes)
+    return np.where(valid.any(axis=1), closes.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1), -1)
+
+
+def fill_gaps(closes):
+    """Forward-fill missing closes between each coin's first and last valid close.
+
+    Leading NaN (not listed yet) and trailing NaN (delisted) are kept.
+    """
+    valid = ~np.isnan(closes)
+    positions = np.where(valid, np.arange(closes.shape[1]), -1)
+    last_seen = np.maximum.accumulate(positions, axis=1)
+    filled = np.take_along_axis(closes, np.maximum(last_seen, 0), axis=1)
+    filled[last_seen < 0] = np.nan
+
+    # Drop the forward fill past the last valid close
+    filled[np.arange(closes.shape[1]) > last_valid_index(closes)[:, None]] = np.nan
+    return filled
+
+
+def _window_counts(values, window):
+    """Sum of every trailing window along axis 1, NaN-free input expected, NaN before a full window."""
+    running = np.cumsum(values, axis=1)
+    sums = np.full(values.shape, np.nan)
+    if window > values.shape[1]:
+        return sums
+    sums[:, window - 1] = running[:, window - 1]
+    sums[:, window:] = running[:, window:] - running[:, :-window]
+    return sums
+
+
+def sma(closes, window):
+    """Simple moving average per coin, NaN unless the last `window` closes are all valid."""
+    valid = ~np.isnan(closes)
+    sums = _window_counts(np.where(valid, closes, 0.0), window)
+    counts = _window_counts(valid.astype(float), window)
+    return np.where(counts == window, sums / window, np.nan)
+
+
+def _recursive_average(values, alpha, window):
+    """Exponential average y = alpha * x + (1 - alpha) * y[-1] per coin, seeded with the SMA of the first `window` values.
+
+    Runs along axis 1 for all coins at once with lfilter. Values are expected valid from each
+    coin's first valid value onward (see fill_gaps); the result is NaN before the seed.
+    """
+    n_coins, n_dates = values.shape
+    valid = ~np.isnan(values)
+    first_valid = np.where(valid.any(axis=1), np.argmax(valid, axis=1), n_dates)
+    seed_index = first_valid + window - 1
+    seeded = seed_index < n_dates
+
+    # Feed the filter zeros before the seed and seed / alpha at the seed, so it starts exactly at the SMA
+    inputs = np.where(valid, values, 0.0)
+    dates = np.arange(n_dates)
+    inputs[dates < seed_index[:, None]] = 0.0
+    rows = np.flatnonzero(seeded)
+    inputs[rows, seed_index[rows]] = sma(values, window)[rows, seed_index[rows]] / alpha
+
+    average = lfilter([alpha], [1.0, alpha - 1.0], inputs, axis=1)
+    average[dates < seed_index[:, None]] = np.nan
+    average[~valid] = np.nan
+    return average
+
+
+def ema(closes, window):
+    """Exponential moving average per coin (alpha = 2 / (window + 1)), seeded with the SMA of the first `window` closes."""
+    return _recursive_average(closes, 2.0 / (window + 1), window)
+
+
+def rsi(closes, length):
+    """Wilder's RSI per coin: RMA of gains over RMA of losses, each seeded with their SMA."""
+    change = np.diff(closes, axis=1, prepend=np.nan)
+    gains = np.where(np.isnan(change), np.nan, np.maximum(change, 0.0))
+    losses = np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0))
+
+    average_gain = _recursive_average(gains, 1.0 / length, length)
+    average_loss = _recursive_average(losses, 1.0 / length, length)
+    return _rsi_from_averages(average_gain, average_loss)
+
+
+def _rsi_from_averages(average_gain, average_loss):
+    """RSI from average gain and loss, 100 without losses and 50 when flat."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_strength = average_gain / average_loss
+        return np.where(average_loss == 0, np.where(average_gain == 0, 50.0, 100.0), 100.0 - 100.0 / (1.0 + relative_strength))
+
+
+def fraction_above(values, reference):
+    """Share of coins with values above reference per date, among coins where both are valid."""
+    valid = ~np.isnan(values) & ~np.isnan(reference)
+    above = (values > reference) & valid
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        return np.where(counts > 0, above.sum(axis=0) / counts, np.nan)
+
+
+def compute_breadth(closes, windows=(50, 200), rsi_length=50, rsi_level=50.0):
+    """Compute the Crypto Breadth series for a coins x dates close panel.
+
+    Returns a dict keyed like the remote API ('50sma', '200sma', '50ema', '200ema', '50rsi'):
+    the share of coins whose close is above its SMA / EMA, and the share whose RSI is above
+    rsi_level.
+    """
+    closes = fill_gaps(np.asarray(closes, dtype="float64"))
+    breadth = {}
+    for window in windows:
+        breadth[f"{window}sma"] = fraction_above(closes, sma(closes, window))
+    for window in windows:
+        breadth[f"{window}ema"] = fraction_above(closes, ema(closes, window))
+
+    levels = np.full(closes.shape, rsi_level)
+    breadth[f"{rsi_length}rsi"] = fraction_above(rsi(closes, rsi_length), levels)
+    return breadth
+
+
+SPECULATION_HORIZONS = (75, 80, 85, 90, 95, 100, 105)
+
+
+def speculation_index(closes, benchmark, horizons=SPECULATION_HORIZONS, rule="all"):
+    """Robust Speculation Index: share of coins whose returns beat the benchmark's over the horizons.
+
+    closes is coins x dates and benchmark (BTC) a close series over the same dates. With
+    rule="all" a coin counts when its return beats the benchmark on every horizon, with
+    rule="majority" on more than half of them. Only coins with a return on every horizon are
+    counted; dates before the longest horizon are NaN.
+    """
+    if rule not in ("all", "majority"):
+        raise ValueError(f"Unknown speculation rule: {rule}")
+    closes = fill_gaps(np.asarray(closes, dtype="float64"))
+    benchmark = np.asarray(benchmark, dtype="float64")
+    horizons = np.asarray(sorted(horizons))
+    longest = horizons[-1]
+
+    index = np.full(closes.shape[1], np.nan)
+    if closes.shape[1] <= longest:
+        return index
+
+    # Windows of the last longest + 1 closes per date; picking the offsets gives every horizon's base close
+    offsets = longest - horizons
+    coin_windows = np.lib.stride_tricks.sliding_window_view(closes, longest + 1, axis=1)
+    benchmark_windows = np.lib.stride_tricks.sliding_window_view(benchmark, longest + 1)
+    coin_returns = closes[:, longest:, None] / coin_windows[..., offsets]  # coins x dates x horizons
+    benchmark_returns = benchmark[longest:, None] / benchmark_windows[..., offsets]
+
+    valid = ~np.isnan(coin_returns).any(axis=2) & ~np.isnan(benchmark_returns).any(axis=1)
+    beats = (coin_returns > benchmark_returns).sum(axis=2)
+    required = len(horizons) if rule == "all" else len(horizons) // 2 + 1
+
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        index[longest:] = np.where(counts > 0, ((beats >= required) & valid).sum(axis=0) / counts, np.nan)
+    return index
+
+
+class BreadthState:
+    """Per-coin indicator state for updating the breadth one day at a time in O(coins).
+
+    Holds a ring buffer of the last closes with the running SMA sums, the EMA values and the RSI
+    average gain/loss (plus their seed sums) for every coin. Feeding the days of a panel through
+    update() gives the same breadth as compute_breadth on the panel up to that day. The state
+    can be saved to and loaded from an .npz file.
+    """
+
+    def __init__(self, coins=(), windows=(50, 200), rsi_length=50, rsi_level=50.0):
+        self.windows = tuple(int(window) for window in windows)
+        self.rsi_length = int(rsi_length)
+        self.rsi_level = float(rsi_level)
+        self.coins = []
+        self.day = 0
+        self.last_date = None
+
+        n_windows = len(self.windows)
+        self.buffer = np.full((0, max(self.windows)), np.nan)  # Last closes, slot = day % buffer size
+        self.last_close = np.full(0, np.nan)
+        self.count = np.zeros(0, dtype=np.int64)  # Closes since listing (gaps forward-filled)
+        self.sums = np.zeros((n_windows, 0))
+        self.ema = np.full((n_windows, 0), np.nan)
+        self.change_count = np.zeros(0, dtype=np.int64)
+        self.gain_sum = np.zeros(0)
+        self.loss_sum = np.zeros(0)
+        self.average_gain = np.full(0, np.nan)
+        self.average_loss = np.full(0, np.nan)
+        self.add_coins(coins)
+
+    def add_coins(self, coins):
+        """Start tracking new coins, they count once listed and seeded like any late listing."""
+        coins = [coin for coin in coins if coin not in self.coins]
+        n = len(coins)
+        self.coins.extend(coins)
+        self.buffer = np.vstack([self.buffer, np.full((n, self.buffer.shape[1]), np.nan)])
+        self.last_close = np.concatenate([self.last_close, np.full(n, np.nan)])
+        self.count = np.concatenate([self.count, np.zeros(n, dtype=np.int64)])
+        self.sums = np.hstack([self.sums, np.zeros((len(self.windows), n))])
+        self.ema = np.hstack([self.ema, np.full((len(self.windows), n), np.nan)])
+        self.change_count = np.concatenate([self.change_count, np.zeros(n, dtype=np.int64)])
+        self.gain_sum = np.concatenate([self.gain_sum, np.zeros(n)])
+        self.loss_sum = np.concatenate([self.loss_sum, np.zeros(n)])
+        self.average_gain = np.concatenate([self.average_gain, np.full(n, np.nan)])
+        self.average_loss = np.concatenate([self.average_loss, np.full(n, np.nan)])
+
+    def update(self, closes, date=None, delisted=None):
+        """Apply one day of closes and return that day's breadth dict.
+
+        closes is either an array in self.coins order or a dict of coin -> close (unknown coins
+        are added). A missing close (NaN) is forward-filled from the coin's last close and the
+        coin still counts, as fill_gaps does in compute_breadth. delisted is a boolean mask in
+        self.coins order of coins past their last close; they drop out like compute_breadth's
+        trailing NaN.
+        """
+        if isinstance(closes, dict):
+            self.add_coins(list(closes))
+            closes = np.array([closes.get(coin, np.nan) for coin in self.coins], dtype="float64")
+        closes = np.asarray(closes, dtype="float64")
+
+        listed_today = ~np.isnan(closes)
+        filled = np.where(listed_today, closes, self.last_close)
+        if delisted is not None:
+            filled[np.asarray(delisted, dtype=bool) & ~listed_today] = np.nan
+        has_close = ~np.isnan(filled)
+        change = filled - self.last_close
+        self.last_close = filled
+        self.count = np.where(has_close, self.count + 1, 0)
+
+        # SMA: add today's close and drop the one leaving each window
+        buffer_size = self.buffer.shape[1]
+        smas = np.full(self.sums.shape, np.nan)
+        for k, window in enumerate(self.windows):
+            dropped = self.buffer[:, (self.day - window) % buffer_size]
+            self.sums[k] += np.where(has_close, filled, 0.0) - np.where(self.count > window, dropped, 0.0)
+            smas[k] = np.where(self.count >= window, self.sums[k] / window, np.nan)
+        self.buffer[:, self.day % buffer_size] = filled
+
+        # EMA, seeded with the SMA once a full window is available
+        for k, window in enumerate(self.windows):
+            alpha = 2.0 / (window + 1)
+            self.ema[k] = np.where(
+                self.count == window, smas[k],
+                np.where(self.count > window, alpha * filled + (1 - alpha) * self.ema[k], np.nan),
+            )
+
+        # RSI: Wilder's averages of gains and losses, seeded with their SMA
+        has_change = ~np.isnan(change)
+        self.change_count = np.where(has_change, self.change_count + 1, 0)
+        gain = np.where(has_change, np.maximum(change, 0.0), 0.0)
+        loss = np.where(has_change, np.maximum(-change, 0.0), 0.0)
+        seeding = has_change & (self.change_count <= self.rsi_length)
+        self.gain_sum = np.where(has_change, self.gain_sum + np.where(seeding, gain, 0.0), 0.0)
+        self.loss_sum = np.where(has_change, self.loss_sum + np.where(seeding, loss, 0.0), 0.0)
+
+        alpha = 1.0 / self.rsi_length
+        seeded = self.change_count == self.rsi_length
+        running = self.change_count > self.rsi_length
+        self.average_gain = np.where(seeded, self.gain_sum / self.rsi_length,
+                                     np.where(running, alpha * gain + (1 - alpha) * self.average_gain, np.nan))
+        self.average_loss = np.where(seeded, self.loss_sum / self.rsi_length,
+                                     np.where(running, alpha * loss + (1 - alpha) * self.average_loss, np.nan))
+
+        self.day += 1
+        self.last_date = date
+
+        # Today's breadth over every listed coin, gaps counted at their forward-filled close
+        breadth = {}
+        for k, window in enumerate(self.windows):
+            breadth[f"{window}sma"] = float(fraction_above(filled, smas[k]))
+        for k, window in enumerate(self.windows):
+            breadth[f"{window}ema"] = float(fraction_above(filled, self.ema[k]))
+        relative_strength_index = _rsi_from_averages(self.average_gain, self.average_loss)
+        breadth[f"{self.rsi_length}rsi"] = float(fraction_above(relative_strength_index, np.full(len(filled), self.rsi_level)))
+        return breadth
+
+    @classmethod
+    def from_history(cls, closes, dates=None, coins=None, **kwargs):
+        """Build the state by replaying a coins x dates panel. Returns (state, breadth history dict).
+
+        The history equals compute_breadth on the same panel: days past a coin's last close in the
+        panel count as delisted.
+        """
+        closes = np.asarray(closes, dtype="float64")
+        state = cls(coins if coins is not None else range(len(closes)), **kwargs)
+        last_valid = last_valid_index(closes)
+        history = {}
+        for t in range(closes.shape[1]):
+            for name, value in state.update(closes[:, t], None if dates is None else dates[t], delisted=t > last_valid).items():
+                history.setdefault(name, []).append(value)
+        return state, {name: np.array(values) for name, values in history.items()}
+
+    _ARRAYS = ("buffer", "last_close", "count", "sums", "ema", "change_count", "gain_sum", "loss_sum", "average_gain", "average_loss")
+
+    def save(self, path):
+        """Persist the state to an .npz file."""
+        np.savez(
+            path,
+            coins=np.array(self.coins, dtype=str),
+            windows=np.array(self.windows),
+            rsi=np.array([self.rsi_length, self.rsi_level]),
+            day=np.array(self.day),
+            last_date=np.array(self.last_date if self.last_date is not None else "NaT", dtype="datetime64[ns]"),
+            **{name: getattr(self, name) for name in self._ARRAYS},
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a state saved with save()."""
+        with np.load(path) as stored:
+            rsi_length, rsi_level = stored["rsi"]
+            state = cls(windows=stored["windows"], rsi_length=rsi_length, rsi_level=rsi_level)
+            state.coins = stored["coins"].tolist()
+            state.day = int(stored["day"])
+            last_date = stored["last_date"]
+            state.last_date = None if np.isnat(last_date) else last_date
+            for name in cls._ARRAYS:
+                setattr(state, name, stored[name])
+        return state
+
+
+def update_breadth(panel_dates, coins, closes, state_path, **kwargs):
+    """Bring a persisted BreadthState up to date with a panel and return the breadth of the new days.
+
+    Only dates after the state's last date are applied, so a daily run costs O(coins) per new
+    bar. Without a saved state, or when a coin with closes before the state's last date joins
+    the panel, the whole panel is replayed and every day is returned. Days past a coin's last
+    close in the panel count as delisted, as in compute_breadth. Returns a DataFrame with a
+    'date' column and one column per breadth series.
+    """
+    state_path = Path(state_path)
+    closes = np.asarray(closes, dtype="float64")
+    panel_dates = np.asarray(panel_dates, dtype="datetime64[ns]")
+
+    state = BreadthState.load(state_path) if state_path.exists() else None
+    if state is not None and state.last_date is not None:
+        # A new coin's earlier closes would be missing from its indicators, so start over
+        added = [coins.index(coin) for coin in coins if coin not in state.coins]
+        if added and (~np.isnan(closes[added][:, panel_dates <= state.last_date])).any():
+            state = None
+    if state is None:
+        state = BreadthState(coins, **kwargs)
+    state.add_coins(coins)
+
+    # Map the panel's coins onto the state's order
+    order = np.array([coins.index(coin) if coin in coins else -1 for coin in state.coins])
+    aligned = np.where(order[:, None] >= 0, closes[np.maximum(order, 0)], np.nan)
+    last_valid = last_valid_index(aligned)
+
+    new_days = np.flatnonzero(panel_dates > state.last_date) if state.last_date is not None else np.arange(len(panel_dates))
+    rows = [dict(date=panel_dates[t], **state.update(aligned[:, t], panel_dates[t], delisted=t > last_valid)) for t in new_days]
+
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state.save(state_path)
+    return pd.DataFrame(rows)
+
+
+def breadth_spreads(columns):
+    """Breadth Difference series (MA50 - MA200) for SMA and EMA from a dict of breadth columns."""
+    return {
+        "sma_spread": columns["50sma"] - columns["200sma"],
+        "ema_spread": columns["50ema"] - columns["200ema"],
+    }
+
+
+def split_benchmark(coins, closes, benchmark="btc"):
+    """Separate the benchmark coin from a panel. Returns (coins, closes, benchmark closes or None)."""
+    lowered = [coin.lower() for coin in coins]
+    if benchmark not in lowered:
+        return coins, closes, None
+    index = lowered.index(benchmark)
+    return coins[:index] + coins[index + 1:], np.delete(closes, index, axis=0), closes[index]
+
+
+def breadth_frame(path, benchmark="btc", state_path=None, **kwargs):
+    """Load a price panel and return a frame shaped like the API_DATA sheet.
+
+    The benchmark coin (BTC by default) is reported as the 'btc' column, excluded from the
+    breadth universe and used for the speculation index ('spec'). With a state_path the breadth is
+    updated incrementally through a persisted BreadthState, and its history is kept next to it as Parquet.
+    """
+    dates, coins, closes = load_price_panel(path)
+    coins, closes, benchmark_closes = split_benchmark(coins, closes, benchmark)
+    frame = pd.DataFrame({"date": dates})
+
+    if benchmark_closes is not None:
+        frame["btc"] = benchmark_closes
+        frame["spec"] = speculation_index(closes, benchmark_closes)
+
+    if state_path is None:
+        for name, values in compute_breadth(closes, **kwargs).items():
+            frame[name] = values
+        return frame
+
+    state_path = Path(state_path)
+    history_path = state_path.with_suffix(".parquet")
+    # State and history are only kept together; when either is missing everything is replayed
+    if not (state_path.exists() and history_path.exists()):
+        state_path.unlink(missing_ok=True)
+        history = None
+    else:
+        history = pd.read_parquet(history_path)
+
+    new_rows = update_breadth(dates, coins, closes, state_path, **kwargs)
+    if history is not None and len(new_rows):
+        # A replayed day replaces the stored one
+        history = pd.concat([history, new_rows], ignore_index=True).drop_duplicates("date", keep="last").sort_values("date", ignore_index=True)
+    elif history is None:
+        history = new_rows
+    history.to_parquet(history_path, index=False)
+
+    return frame.merge(history, on="date", how="left")
@@ -0,0 +1,103 @@
+"""Decimation of long time series for Plotly charts.
+
+A daily history of several thousand points per trace is more than a chart can show at its pixel
+width. The helpers here reduce each trace to a point budget before it is sent to the browser,
+with min/max bucketing (keeps every bucket's low and high, so turning points survive) or
+Largest-Triangle-Three-Buckets, and switch dense traces to WebGL.
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+DEFAULT_MAX_POINTS = 2000  # About two points per horizontal pixel of a wide chart
+WEBGL_THRESHOLD = 1000  # Traces with more points than this are drawn with Scattergl
+
+
+def minmax_indices(y, n_buckets):
+    """Indices of the minimum and maximum of each of n_buckets equal buckets, in order."""
+    y = np.asarray(y, dtype="float64")
+    n = len(y)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+
+    # Pad to a full last bucket; NaN never wins a min or max
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    starts = np.arange(n_buckets) * size
+    lows = starts + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    highs = starts + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    return np.unique(np.concatenate([lows, highs]).clip(max=n - 1))
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: n_out indices that keep the visual shape of the series."""
+    x = np.asarray(x, dtype="float64")
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[stop:next_stop].mean() if next_stop > stop else x[-1]
+        next_y = y[stop:next_stop].mean() if next_stop > stop else y[-1]
+
+        # Point forming the largest triangle with the previous selection and the next average
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+
+def drawdown_extremes(equity):
+    """Indices of the peak and trough of the largest drawdown of an equity curve."""
+    equity = np.asarray(equity, dtype="float64")
+    trough = int(np.argmax(1 - equity / np.maximum.accumulate(equity)))
+    peak = int(np.argmax(equity[:trough + 1]))
+    return [peak, trough]
+
+
+def decimate_indices(x, y, max_points=DEFAULT_MAX_POINTS, method="minmax", keep=()):
+    """Indices of the points to plot: at most about max_points plus the first, last and keep indices."""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    if method == "lttb":
+        x = np.asarray(x)
+        numeric_x = x.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+        indices = lttb_indices(numeric_x, y, max_points)
+    elif method == "minmax":
+        indices = minmax_indices(y, max_points // 2)
+    else:
+        raise ValueError(f"Unknown decimation method: {method}")
+
+    return np.unique(np.concatenate([indices, [0, n - 1], np.asarray(keep, dtype=np.int64)]))
+
+
+def decimated_scatter(x, y, max_points=DEFAULT_MAX_POINTS, method="minmax", keep=(), **kwargs):
+    """A go.Scatter (or go.Scattergl for dense traces) of the decimated series.
+
+    keep lists indices that must survive decimation, e.g. drawdown_extremes() of an equity curve.
+    Other keyword arguments are passed to the trace.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    indices = decimate_indices(x, y, max_points=max_points, method=method, keep=keep)
+
+    trace = go.Scattergl if len(indices) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x[indices], y=y[indices], **kwargs)
+
+
+def view_slice(dates, date_range):
+    """Slice of a sorted datetime64 index covering the calendar days date_range (start, end), both inclusive.
+
+    The end bound is midnight after the last day, so dates carrying a time of day on that day are kept.
+    """
+    start = np.datetime64(np.datetime64(date_range[0], "D"), "ns")
+    end = np.datetime64(np.datetime64(date_range[1], "D") + 1, "ns")
+    return slice(int(np.searchsorted(dates, start, side="left")), int(np.searchsorted(dates, end, side="left")))
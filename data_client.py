@@ -0,0 +1,76 @@
+"""Shared HTTP client for the Google Apps Script sheet endpoints.
+
+All requests go through one pooled requests.Session with connect and read timeouts, retries with
+exponential backoff on connection errors and 429/5xx responses, and gzip transfer encoding.
+Responses carrying an ETag or Last-Modified header are revalidated with a conditional request
+the next time, so an unchanged sheet costs a 304 instead of a full download.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Apps Script deployments serving the sheets used by the pages
+BREADTH_ENDPOINT = 'https://script.google.com/macros/s/AKfycbyArX-VqTB_BGt_iRJ-2vCPu1mfY4McZw85m7XJu6nOeXvwt1suVoCwAhPdYlNdRrQn/exec'
+BACKTEST_ENDPOINT = 'https://script.google.com/macros/s/AKfycbz5mJEV8UeCT4Jn8NAZnj_Poq5OCXQ--E8XNcMK306g8ZDdyFf73p0fMo9YximVmIGK/exec'
+
+TIMEOUT = (5, 60)  # Connect and read timeouts in seconds; Apps Script can take a while to build a sheet
+RETRIES = 3
+BACKOFF = 0.5  # Seconds before the first retry, doubled for every further one
+POOL_SIZE = 8
+
+_session = None
+_validators = {}  # (url, params) -> response headers used to revalidate it
+_lock = threading.Lock()
+
+
+def session():
+    """The process-wide session, created on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRIES,
+                read=1,  # A stalled read already cost a full read timeout, retry it only once
+                backoff_factor=BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["Accept-Encoding"] = "gzip, deflate"
+        return _session
+
+
+def get_json(url, params=None, conditional=False, timeout=TIMEOUT):
+    """GET url and decode the JSON body.
+
+    With conditional=True the request carries the validators of the previous response for the
+    same url and params, and None is returned when the server answers 304 Not Modified.
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    headers = {}
+    if conditional:
+        with _lock:
+            validators = _validators.get(key, {})
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+
+    response = session().get(url, params=params, headers=headers, timeout=timeout)
+    if response.status_code == 304 and headers:
+        return None
+    response.raise_for_status()
+
+    validators = {name: response.headers[name] for name in ("ETag", "Last-Modified") if name in response.headers}
+    with _lock:
+        if validators:
+            _validators[key] = validators
+        else:
+            _validators.pop(key, None)
+    return response.json()
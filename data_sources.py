@@ -0,0 +1,249 @@
+"""Pluggable sources for the sheets the pages read.
+
+Every source returns a sheet as a SheetDataset with load_dataset(sheet_name, trim, derive), so the
+pages do not care where the data comes from. The source is chosen with TRW_DATA_SOURCE:
+
+- unset or "apps_script": the Google Apps Script endpoints, through the on-disk sheet cache
+- "file:<directory>": local <sheet>.arrow, .feather, .parquet or .csv files; Arrow IPC files are
+  memory-mapped, so loading a sheet is a matter of milliseconds
+- "http://...": any server speaking the Apps Script protocol (?sheet=...&since=...), such as the
+  stand-in started by `python data_sources.py serve <directory>`
+
+`python data_sources.py snapshot <directory>` writes the sheets of the current source to Arrow
+files for the file source.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+import sheet_cache
+from data_client import BACKTEST_ENDPOINT, BREADTH_ENDPOINT
+from sheet_cache import DATE_COLUMN, arrays_to_dataset, frame_to_dataset, typed_frame
+
+SHEETS = ("API_DATA", "R1")  # Sheets read by the pages
+FILE_SUFFIXES = (".arrow", ".feather", ".parquet", ".csv")  # Looked up in this order
+
+
+class AppsScriptSource:
+    """Sheets served over HTTP by Apps Script endpoints, cached on disk and refreshed in the background."""
+
+    def __init__(self, endpoints, max_age=600):
+        self.endpoints = endpoints  # Sheet name -> endpoint URL, None for any other sheet
+        self.max_age = max_age
+
+    def endpoint(self, sheet_name):
+        return self.endpoints.get(sheet_name, self.endpoints.get(None))
+
+    def load_dataset(self, sheet_name, trim=True, derive=None):
+        return sheet_cache.load_dataset(self.endpoint(sheet_name), sheet_name, max_age=self.max_age, trim=trim, derive=derive)
+
+    def prefetch(self, sheet_names):
+        sheet_cache.prefetch([(self.endpoint(sheet_name), sheet_name) for sheet_name in sheet_names])
+
+
+class FileSource:
+    """Sheets stored as local files, one file per sheet, reloaded when a file changes."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._datasets = {}  # (path, trim, derive) -> (modification time, SheetDataset)
+        self._lock = threading.Lock()
+
+    def path(self, sheet_name):
+        for suffix in FILE_SUFFIXES:
+            path = self.directory / f"{sheet_name}{suffix}"
+            if path.exists():
+                return path
+        raise FileNotFoundError(f"No {'/'.join(FILE_SUFFIXES)} file for sheet {sheet_name} in {self.directory}")
+
+    def load_frame(self, sheet_name):
+        """The sheet as a typed DataFrame."""
+        path = self.path(sheet_name)
+        if path.suffix in (".arrow", ".feather"):
+            with pa.memory_map(str(path)) as source:
+                return typed_frame(pyarrow.ipc.open_file(source).read_pandas())
+        frame = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+        return typed_frame(frame)
+
+    def load_dataset(self, sheet_name, trim=True, derive=None):
+        path = self.path(sheet_name)
+        modified = path.stat().st_mtime_ns
+        key = (path, trim, derive)
+        with self._lock:
+            entry = self._datasets.get(key)
+        if entry is not None and entry[0] == modified:
+            return entry[1]
+
+        if path.suffix in (".arrow", ".feather"):
+            dataset = _mapped_dataset(path, trim=trim, derive=derive)
+        else:
+            dataset = frame_to_dataset(self.load_frame(sheet_name), trim=trim, derive=derive)
+        with self._lock:
+            self._datasets[key] = (modified, dataset)
+        return dataset
+
+    def prefetch(self, sheet_names):
+        pass  # Local files need no warming
+
+
+def _mapped_dataset(path, trim=True, derive=None):
+    """SheetDataset over a memory-mapped Arrow IPC file; float64 columns without nulls are not copied."""
+    table = pyarrow.ipc.open_file(pa.memory_map(str(path))).read_all()
+
+    def values(column, dtype):
+        # A single-chunk column is a view of the mapped file; anything else is converted
+        if column.num_chunks == 1 and column.null_count == 0 and column.type == pa.from_numpy_dtype(np.dtype(dtype)):
+            return column.chunk(0).to_numpy(zero_copy_only=True)
+        return np.asarray(column.to_pandas(), dtype=dtype)
+
+    names = [name for name in table.column_names if name != DATE_COLUMN]
+    if DATE_COLUMN in table.column_names and pa.types.is_timestamp(table.column(DATE_COLUMN).type):
+        # Cast to naive nanoseconds (UTC for zoned columns) without going through pandas
+        dates = table.column(DATE_COLUMN).cast(pa.timestamp("ns")).to_numpy()
+    elif DATE_COLUMN in table.column_names:
+        dates = pd.to_datetime(table.column(DATE_COLUMN).to_pandas(), errors="coerce").to_numpy(dtype="datetime64[ns]")
+    else:
+        dates = np.array([], dtype="datetime64[ns]")
+    arrays = {name: values(table.column(name), "float64") for name in names}
+    return arrays_to_dataset(dates, arrays, trim=trim, derive=derive)
+
+
+def write_arrow(frame, path):
+    """Write a typed sheet frame as an uncompressed Arrow IPC file in one record batch, for memory-mapping.
+
+    The file is written next to path and renamed over it, so datasets still mapping the old
+    file keep reading its inode instead of a truncated one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(temporary), "wb") as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(len(frame), 1))
+    os.replace(temporary, path)
+
+
+def source_from_config(config):
+    """Build the source described by a TRW_DATA_SOURCE value."""
+    if not config or config == "apps_script":
+        return AppsScriptSource({"API_DATA": BREADTH_ENDPOINT, "R1": BACKTEST_ENDPOINT})
+    if config.startswith("file:"):
+        return FileSource(config[len("file:"):])
+    if config.startswith(("http://", "https://")):
+        return AppsScriptSource({None: config})
+    raise ValueError(f"Unknown TRW_DATA_SOURCE: {config}")
+
+
+_source = None
+
+
+def data_source():
+    """The source configured by TRW_DATA_SOURCE, shared by the whole process."""
+    global _source
+    if _source is None:
+        _source = source_from_config(os.environ.get("TRW_DATA_SOURCE"))
+    return _source
+
+
+### STAND-IN SERVER ###
+
+def _payload(frame):
+    """A sheet frame as the Apps Script JSON payload: one list per column, dates as ISO strings."""
+    data = {}
+    for name in frame.columns:
+        column = frame[name]
+        if name == DATE_COLUMN:
+            data[name] = column.dt.strftime("%Y-%m-%dT%H:%M:%S.000Z").where(column.notna(), None).tolist()
+        else:
+            data[name] = column.astype(object).where(column.notna(), None).tolist()
+    return data
+
+
+def make_server(directory, host="127.0.0.1", port=8765):
+    """An HTTP server answering Apps Script style requests from the sheet files in directory.
+
+    It honours the since parameter, gzip and ETag revalidation, so the whole client path can be
+    exercised and load-tested without network.
+    """
+    source = FileSource(directory)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            sheet_name = query.get("sheet", [""])[0]
+            since = query.get("since", [None])[0]
+            try:
+                path = source.path(sheet_name)
+            except FileNotFoundError as e:
+                self.send_error(404, str(e))
+                return
+
+            stat = path.stat()
+            etag = '"' + hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}:{since}".encode()).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            frame = source.load_frame(sheet_name)
+            if since is not None and DATE_COLUMN in frame.columns:
+                frame = frame[frame[DATE_COLUMN] >= pd.Timestamp(since).tz_localize(frame[DATE_COLUMN].dt.tz)]
+            body = json.dumps(_payload(frame)).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve or snapshot the sheet data used by the pages.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve sheet files over the Apps Script protocol")
+    serve.add_argument("directory")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    snapshot = commands.add_parser("snapshot", help="Write the sheets of the configured source as Arrow files")
+    snapshot.add_argument("directory")
+    snapshot.add_argument("--sheets", nargs="+", default=list(SHEETS))
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = make_server(args.directory, args.host, args.port)
+        print(f"Serving {args.directory} at http://{args.host}:{server.server_port}/exec")
+        server.serve_forever()
+    else:
+        source = data_source()
+        for sheet_name in args.sheets:
+            if isinstance(source, FileSource):
+                frame = source.load_frame(sheet_name)
+            else:
+                frame = sheet_cache.load_sheet(source.endpoint(sheet_name), sheet_name, max_age=float("inf"))
+            write_arrow(frame, Path(args.directory) / f"{sheet_name}.arrow")
+            print(f"Wrote {sheet_name}: {len(frame)} rows")
+
+
+if __name__ == "__main__":
+    main()
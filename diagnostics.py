@@ -0,0 +1,93 @@
+"""Per-stage timing for the pages, shown in a diagnostics expander and logged as JSON lines.
+
+Set TRW_DIAGNOSTICS=1 to turn it on. Each script run calls start_run(); stage() and
+cached_stage() then record how long data loading, parsing, backtesting, chart rendering and
+exports took, and whether a Streamlit cache was hit. When it is off a stage is a single
+attribute lookup, so the instrumentation can stay in place.
+"""
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("trw.diagnostics")
+
+ENABLED = os.environ.get("TRW_DIAGNOSTICS", "") not in ("", "0")
+
+if ENABLED and not logger.handlers:
+    # One JSON object per line on stderr, independent of Streamlit's own logging setup
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_run = threading.local()  # Records of the script run on this thread, None when disabled
+
+
+def start_run(enabled=ENABLED):
+    """Start collecting stage records for the current script run."""
+    _run.records = [] if enabled else None
+
+
+def enabled():
+    return getattr(_run, "records", None) is not None
+
+
+def records():
+    """Stage records of the current run, in the order the stages finished."""
+    return list(getattr(_run, "records", None) or [])
+
+
+def _record(records, name, seconds, labels):
+    entry = {"stage": name, "ms": round(seconds * 1000, 3), **labels}
+    records.append(entry)
+    logger.info(json.dumps(entry, default=str))
+
+
+@contextmanager
+def stage(name, **labels):
+    """Time the enclosed block as a stage; labels (e.g. sheet='R1') are stored with it."""
+    records = getattr(_run, "records", None)
+    if records is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(records, name, time.perf_counter() - start, labels)
+
+
+def cached_stage(name, cache):
+    """Apply a Streamlit cache decorator and record every call as a stage with a cache hit or miss.
+
+    Used as @cached_stage("calculate_equities", st.cache_data(ttl=600)) in place of the cache
+    decorator itself. A call is a miss when the cached function body actually ran.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def compute(*args, **kwargs):
+            _run.missed = True
+            return function(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            records = getattr(_run, "records", None)
+            if records is None:
+                return cached(*args, **kwargs)
+            _run.missed = False
+            start = time.perf_counter()
+            result = cached(*args, **kwargs)
+            _record(records, name, time.perf_counter() - start, {"cache": "miss" if _run.missed else "hit"})
+            return result
+
+        call.clear = cached.clear
+        return call
+    return decorate
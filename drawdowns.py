@@ -0,0 +1,86 @@
+"""Drawdown analytics: underwater curves, drawdown episodes and time under water.
+
+Depths are measured from the running peak in effect at each bar. Everything is O(n) array
+operations over one equity curve or a 2D batch of curves (curves x bars), so the batch
+statistics can run inside threshold sweeps and bootstraps.
+"""
+import numpy as np
+import pandas as pd
+
+EPISODE_COLUMNS = ["Start", "Trough", "Recovery", "Depth", "Decline Bars", "Recovery Bars", "Bars Under Water"]
+
+
+def underwater(indexed_equity):
+    """Drawdown from the running peak at every bar as a fraction <= 0, for a curve or a 2D batch."""
+    equity = np.asarray(indexed_equity, dtype=float)
+    return equity / np.maximum.accumulate(equity, axis=-1) - 1
+
+
+def drawdown_statistics_batch(indexed_equities):
+    """Max drawdown, longest drawdown and time under water of every row of a 2D array of curves.
+
+    "Max Drawdown Duration" is the longest run of consecutive bars below the previous peak and
+    "Time Under Water" the share of bars below it.
+    """
+    equity = np.atleast_2d(np.asarray(indexed_equities, dtype=float))
+    ratio = equity / np.maximum.accumulate(equity, axis=1)
+    below = ratio < 1
+    steps = np.arange(equity.shape[1], dtype=np.int32)
+
+    # Bars since the last bar at a peak
+    last_peak = np.maximum.accumulate(np.where(below, 0, steps), axis=1)
+    return {
+        "Max Drawdown": 1 - ratio.min(axis=1),
+        "Max Drawdown Duration": (steps - last_peak).max(axis=1),
+        "Time Under Water": below.mean(axis=1),
+    }
+
+
+def drawdown_episodes(indexed_equity, dates=None, top=None):
+    """Every drawdown episode of one equity curve, deepest first, or only the top deepest ones.
+
+    An episode starts at a peak, reaches its trough and ends at the first bar back at that peak;
+    Recovery and Recovery Bars are missing when the curve has not recovered yet. Start, Trough and
+    Recovery are bar indices, or the matching dates when dates (one per equity value) are given.
+    """
+    depth = underwater(indexed_equity)
+    below = depth < 0
+    steps = np.arange(len(depth))
+
+    # First bar of every episode below the peak and first bar back at it (len(depth) if never)
+    edges = np.diff(below.astype(np.int8), prepend=0, append=0)
+    first = np.flatnonzero(edges == 1)
+    end = np.flatnonzero(edges == -1)
+    if len(first) == 0:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+
+    # Deepest point per episode, then the first bar reaching it; bars after a recovery are at
+    # depth 0 and do not affect either reduction
+    episode_depth = np.minimum.reduceat(depth, first)
+    episode = np.maximum(np.cumsum(edges[:-1] == 1) - 1, 0)
+    at_trough = below & (depth == episode_depth[episode])
+    trough = np.minimum.reduceat(np.where(at_trough, steps, len(depth)), first)
+
+    start = first - 1
+    recovery = pd.array(end, dtype="Int64")
+    recovery[end == len(depth)] = pd.NA
+    episodes = pd.DataFrame({
+        "Start": start,
+        "Trough": trough,
+        "Recovery": recovery,
+        "Depth": -episode_depth,
+        "Decline Bars": trough - start,
+        "Recovery Bars": recovery - trough,
+        "Bars Under Water": end - first,
+    })
+
+    episodes = episodes.sort_values("Depth", ascending=False, kind="stable").reset_index(drop=True)
+    if top is not None:
+        episodes = episodes.head(top)
+
+    if dates is not None:
+        dates = pd.DatetimeIndex(dates)
+        for column in ("Start", "Trough", "Recovery"):
+            indices = episodes[column]
+            episodes[column] = pd.Series(dates[indices.fillna(0).astype(int)], index=episodes.index).where(indices.notna())
+    return episodes
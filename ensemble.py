@@ -0,0 +1,172 @@
+"""Comparison of several TPIs and weighted ensembles of them, evaluated as 2D batches.
+
+Uploaded TPIs (one file per TPI, or one wide CSV with a column per TPI) are aligned to the return
+dates and stacked into a signal matrix (TPIs x bars) on their common date range. Every row is
+backtested and scored in one calculate_metrics_batch call. An ensemble is a weighted average of
+the rows; ensemble_search scores thousands of weight vectors as composite signal matrices
+(weights @ signals), so it stays interactive with 20+ components.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from backtest import align_tpi, calculate_metrics_batch, position_equity, position_growth, tpi_exposure, tpi_positions
+from trades import trade_statistics_batch
+
+
+@dataclass(frozen=True)
+class SignalMatrix:
+    """Several TPIs aligned to return rows start:stop, one row of signals per TPI.
+
+    issues maps each TPI name to the Alignment.issues() repaired while aligning it.
+    """
+    names: list
+    dates: np.ndarray
+    signals: np.ndarray
+    start: int
+    stop: int
+    issues: dict
+
+
+def unique_names(names):
+    """names with every repeat suffixed " (2)", " (3)", ... so none is overwritten when used as keys."""
+    taken = set(names)
+    unique = []
+    for name in names:
+        candidate, number = name, 1
+        # A suffixed name skips names already in the list as well as the ones handed out
+        while candidate in unique or (number > 1 and candidate in taken):
+            number += 1
+            candidate = f"{name} ({number})"
+        unique.append(candidate)
+    return unique
+
+
+def tpi_components(frames):
+    """Every TPI in a dict of file name -> frame read with read_tpi_csv(columns=None).
+
+    A file with a 'tpi' column holds one TPI named after the file; any other file is a wide CSV
+    with one TPI per column. Returns a dict of name -> frame with 'date' and 'tpi' columns, and
+    the names of the files skipped for lacking a 'date' column.
+    """
+    components, skipped = {}, []
+    for file_name, frame in frames.items():
+        if "date" not in frame.columns:
+            skipped.append(file_name)
+            continue
+        if "tpi" in frame.columns:
+            components[file_name] = frame[["date", "tpi"]]
+            continue
+        for column in frame.columns.drop("date"):
+            if frame[column].notna().any():
+                name = column if len(frames) == 1 else f"{file_name}/{column}"
+                components[name] = pd.DataFrame({"date": frame["date"], "tpi": frame[column]})
+    return components, skipped
+
+
+def align_signals(components, return_dates):
+    """Align every TPI with align_tpi (by calendar day) and stack them on the date range they all cover."""
+    alignments = {name: align_tpi(frame["date"], frame["tpi"], return_dates) for name, frame in components.items()}
+    start = max(alignment.start for alignment in alignments.values())
+    stop = min(alignment.stop for alignment in alignments.values())
+    if stop <= start:
+        raise ValueError("The TPIs have no dates in common.")
+
+    signals = np.vstack([alignment.tpi[start - alignment.start:stop - alignment.start] for alignment in alignments.values()])
+    first = next(iter(alignments.values()))
+    return SignalMatrix(names=list(alignments), dates=first.dates[start - first.start:stop - first.start], signals=signals, start=start, stop=stop,
+                        issues={name: alignment.issues() for name, alignment in alignments.items()})
+
+
+def stack_signals(components, n_returns):
+    """Stack every TPI by row position, for return data without dates, on the rows they all cover.
+
+    Row i of each TPI is paired with return i, as a single TPI is without dates. The dates are
+    the first TPI's.
+    """
+    stop = min(n_returns, *(len(frame) for frame in components.values()))
+    if stop == 0:
+        raise ValueError("The TPIs have no rows in common with the return data.")
+    signals = np.vstack([frame["tpi"].to_numpy(dtype=float)[:stop] for frame in components.values()])
+    first = next(iter(components.values()))
+    return SignalMatrix(names=list(components), dates=first["date"].to_numpy()[:stop], signals=signals, start=0, stop=stop,
+                        issues={name: [] for name in components})
+
+
+def evaluate_signals(daily_returns, signals, long_threshold, short_threshold, names=None, fee=0.0, slippage=0.0,
+                     sizing="threshold", max_leverage=1.0):
+    """Backtest every row of a signal matrix in one batch.
+
+    Returns the metrics table (metrics and trade statistics x TPIs, scored against buy-and-hold),
+    the strategy equity curves (TPIs x bars + 1) and the correlation matrix of the strategies'
+    daily returns.
+    """
+    signals = np.atleast_2d(np.asarray(signals, dtype=float))
+    returns = np.asarray(daily_returns, dtype=float)[:signals.shape[1]]
+    signals = signals[:, :len(returns)]
+    names = list(names) if names is not None else list(range(len(signals)))
+
+    exposure = tpi_exposure(signals, long_threshold, short_threshold, sizing, max_leverage)
+    growth = position_growth(returns, exposure, fee=fee, slippage=slippage)
+    equity = np.ones((len(signals), len(returns) + 1))
+    np.cumprod(growth, axis=1, out=equity[:, 1:])
+    buy_and_hold_equity = position_equity(returns, np.ones(len(returns)), fee=fee, slippage=slippage)
+
+    metrics = calculate_metrics_batch(equity, benchmark_equity=buy_and_hold_equity)
+    metrics.update(trade_statistics_batch(tpi_positions(signals, long_threshold, short_threshold), equity))
+
+    # A strategy that never trades has constant returns and no correlation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.corrcoef(growth) if len(signals) > 1 else np.ones((1, 1))
+
+    return (pd.DataFrame(metrics, index=names).T, equity,
+            pd.DataFrame(np.atleast_2d(correlation), index=names, columns=names))
+
+
+def ensemble_search(daily_returns, signals, long_threshold, short_threshold, metric="Sharpe Ratio", n_candidates=1000, rounds=3,
+                    top=10, chunk_size=512, seed=None, names=None, fee=0.0, slippage=0.0, sizing="threshold", max_leverage=1.0):
+    """Search the non-negative weights (summing to 1) whose composite TPI maximizes metric.
+
+    The first round scores every single TPI, the equal-weight ensemble and n_candidates random
+    weight vectors; each further round draws n_candidates vectors concentrated around the best
+    one so far. A composite is weights @ signals, thresholded like a single TPI. Returns the
+    top candidates as a table of weights and scores, best first. Scores are in-sample.
+    """
+    signals = np.atleast_2d(np.asarray(signals, dtype=float))
+    returns = np.asarray(daily_returns, dtype=float)[:signals.shape[1]]
+    signals = signals[:, :len(returns)]
+    names = list(names) if names is not None else list(range(len(signals)))
+    buy_and_hold_equity = position_equity(returns, np.ones(len(returns)), fee=fee, slippage=slippage)
+    rng = np.random.default_rng(seed)
+    k = len(signals)
+
+    def score(weights):
+        scores = np.empty(len(weights))
+        for start in range(0, len(weights), chunk_size):
+            composite = weights[start:start + chunk_size] @ signals
+            exposure = tpi_exposure(composite, long_threshold, short_threshold, sizing, max_leverage)
+            equity = position_equity(returns, exposure, fee=fee, slippage=slippage)
+            scores[start:start + chunk_size] = calculate_metrics_batch(equity, benchmark_equity=buy_and_hold_equity)[metric]
+        return np.where(np.isnan(scores), -np.inf, scores)
+
+    weights = np.vstack([np.eye(k), np.full((1, k), 1 / k), rng.dirichlet(np.ones(k), n_candidates)])
+    scores = score(weights)
+    all_weights, all_scores = [weights], [scores]
+    best, best_score = weights[np.argmax(scores)], scores.max()
+    concentration = 50.0
+    for _ in range(1, rounds):
+        # Dirichlet draws with mean close to the best weights so far, tighter every round
+        weights = rng.dirichlet(1e-3 + best * concentration * k, n_candidates)
+        scores = score(weights)
+        if scores.max() > best_score:
+            best, best_score = weights[np.argmax(scores)], scores.max()
+        all_weights.append(weights)
+        all_scores.append(scores)
+        concentration *= 4
+
+    weights, scores = np.vstack(all_weights), np.concatenate(all_scores)
+    order = np.argsort(-scores, kind="stable")[:top]
+    table = pd.DataFrame(weights[order], columns=names)
+    table[metric] = np.where(np.isinf(scores[order]), np.nan, scores[order])
+    return table
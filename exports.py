@@ -0,0 +1,60 @@
+"""Serialization of downloadable tables to CSV, gzip-compressed CSV, Parquet and Arrow IPC.
+
+Downloads are offered as deferred callables, so a table is only serialized when someone clicks
+the button. Breadth exports are also memoized on the SheetDataset, once per data version and
+format, and every later click reuses the bytes.
+"""
+import gzip
+import io
+
+import pyarrow as pa
+import pyarrow.ipc
+
+# Format name -> (file extension, MIME type)
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def export_bytes(frame, format_name):
+    """Serialize a DataFrame (without its index) in one of FORMATS."""
+    if format_name == "CSV":
+        return frame.to_csv(index=False).encode()
+    if format_name == "CSV (gzip)":
+        return gzip.compress(frame.to_csv(index=False).encode(), compresslevel=6)
+    if format_name == "Parquet":
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False, compression="zstd")
+        return buffer.getvalue()
+    if format_name == "Arrow":
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pyarrow.ipc.new_file(sink, table.schema, options=pyarrow.ipc.IpcWriteOptions(compression="zstd")) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unknown export format: {format_name}")
+
+
+def file_name(stem, format_name):
+    return f"{stem}.{FORMATS[format_name][0]}"
+
+
+def mime_type(format_name):
+    return FORMATS[format_name][1]
+
+
+def deferred_export(build_frame, format_name, dataset=None, key=None):
+    """A callable returning the export bytes of build_frame(), for st.download_button(data=...).
+
+    With a dataset the bytes are memoized on it under key and the format, so they are built at
+    most once per data version.
+    """
+    def export():
+        return export_bytes(build_frame(), format_name)
+
+    if dataset is None:
+        return export
+    return lambda: dataset.derived(f"export:{key}:{format_name}", export)
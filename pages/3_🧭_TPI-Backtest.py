@@ -1,9 +1,24 @@
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.stats import skew, kurtosis
 import plotly.graph_objects as go
-import requests
+import plotly.express as px
+from plotly.subplots import make_subplots
+
+import backtest
+import diagnostics
+from array_cache import cached_arrays, shared_cache
+from backtest import align_tpi, backtest_all_assets, calculate_metrics, calculate_metrics_batch, calculate_rolling_metrics, read_tpi_csv, walk_forward
+from charts import DEFAULT_MAX_POINTS, decimated_scatter, drawdown_extremes
+from data_sources import data_source
+from diagnostics import cached_stage, stage
+from drawdowns import drawdown_episodes, underwater
+from ensemble import align_signals, ensemble_search, evaluate_signals, stack_signals, tpi_components, unique_names
+from exports import FORMATS, deferred_export, file_name, mime_type
+from significance import bootstrap_metrics
+from trades import trade_ledger, trade_statistics
 
 
 # Layout
@@ -12,146 +27,178 @@ st.set_page_config(
     layout = "wide"
 )
 
+# Stage timings of this run, shown at the bottom when TRW_DIAGNOSTICS is set
+diagnostics.start_run()
+
+# Fetch the returns and the Crypto Breadth sheet concurrently in the background, so neither
+# page waits for the other's first download
+data_source().prefetch(["R1", "API_DATA"])
+
 ### FUNCTIONS ###
-@st.cache_data(ttl=600)
 def get_data_1(sheet_name, print_data):
-    url = f'https://script.google.com/macros/s/AKfycbz5mJEV8UeCT4Jn8NAZnj_Poq5OCXQ--E8XNcMK306g8ZDdyFf73p0fMo9YximVmIGK/exec?sheet={sheet_name}'
-    response = requests.get(url)
-    data = response.json()
-    return data[print_data]
-
-
-@st.cache_data(ttl=600)
-def calculate_equities(daily_returns, tpi_data, long_threshold, short_threshold):
-    """Calculate strategy and buy-and-hold equities based on daily returns and TPI signals."""
-    strategy_equity = [1]  # Starting equity for strategy
-    buy_and_hold_equity = [1]  # Starting equity for buy-and-hold
-    long_only_equity = [1]
-
-    # Calculate the equity based on signals in 'tpi' column
-    for i, signal in enumerate(tpi_data):
-        if i < len(daily_returns):
-            daily_return = daily_returns[i]
-
-            # Strategy equity update based on 'tpi' signal
-            if signal > long_threshold:
-                strategy_equity.append(strategy_equity[-1] * (1 + daily_return))  # Long
-                long_only_equity.append(long_only_equity[-1] * (1 + daily_return))
-            elif signal < short_threshold:
-                strategy_equity.append(strategy_equity[-1] * (1 - daily_return))  # Short
-                long_only_equity.append(long_only_equity[-1])
-            else:
-                strategy_equity.append(strategy_equity[-1])  # Neutral/cash
-                long_only_equity.append(long_only_equity[-1])
-
-            # Buy-and-hold equity (always long)
-            buy_and_hold_equity.append(buy_and_hold_equity[-1] * (1 + daily_return))
-        else:
-            # If daily returns data is shorter than tpi data
-            strategy_equity.append(strategy_equity[-1])
-            buy_and_hold_equity.append(buy_and_hold_equity[-1])
-            long_only_equity.append(buy_and_hold_equity[-1])
-
-    return strategy_equity, buy_and_hold_equity, long_only_equity
-
-def calculate_metrics(indexed_equity, benchmark_equity=None, risk_free_rate=0.0):
-    equity = np.array(indexed_equity)
-    daily_returns = np.diff(equity) / equity[:-1]
-    
-    if benchmark_equity is not None:
-        benchmark_returns = np.diff(benchmark_equity) / benchmark_equity[:-1]
-    else:
-        benchmark_returns = None
-
-    # Positive and negative returns
-    positive_returns = daily_returns[daily_returns > 0]
-    negative_returns = daily_returns[daily_returns < 0]
-
-    mean_positive = np.mean(positive_returns) if len(positive_returns) > 0 else 0
-    std_positive = np.std(positive_returns) if len(positive_returns) > 0 else 0
-    mean_negative = np.mean(negative_returns) if len(negative_returns) > 0 else 0
-    std_negative = np.std(negative_returns) if len(negative_returns) > 0 else 0
-
-    # Mean and standard deviation of daily returns
-    mean_return = np.mean(daily_returns)
-    std_dev = np.std(daily_returns)
-    downside_returns = negative_returns
-    sortino_denominator = np.std(downside_returns) if len(downside_returns) > 0 else 1
-
-    # Annualization factor (252 trading days assumed)
-    trading_days_per_year = 252
-    annualized_mean = mean_return * trading_days_per_year
-    annualized_std_dev = std_dev * np.sqrt(trading_days_per_year)
-    annualized_sortino_denominator = sortino_denominator * np.sqrt(trading_days_per_year)
-
-    # Sharpe Ratio (annualized)
-    sharpe_ratio = (annualized_mean - risk_free_rate) / annualized_std_dev if annualized_std_dev != 0 else np.nan
-
-    # Sortino Ratio (annualized)
-    sortino_ratio = (annualized_mean - risk_free_rate) / annualized_sortino_denominator if annualized_sortino_denominator != 0 else np.nan
-
-    # Omega Ratio
-    threshold = 0
-    gains = positive_returns
-    losses = -negative_returns
-    omega_ratio = gains.sum() / losses.sum() if losses.sum() != 0 else np.nan
-
-    # Alpha and Beta
-    if benchmark_returns is not None:
-        covariance = np.cov(daily_returns, benchmark_returns)[0, 1]
-        beta = covariance / np.var(benchmark_returns) if np.var(benchmark_returns) != 0 else np.nan
-        annualized_benchmark_mean = np.mean(benchmark_returns) * trading_days_per_year
-        alpha = (annualized_mean - risk_free_rate) - (beta * (annualized_benchmark_mean - risk_free_rate))
-    else:
-        alpha = np.nan
-        beta = np.nan
-
-    # Direct excess return for comparison
-    if benchmark_returns is not None:
-        excess_return = annualized_mean - annualized_benchmark_mean
-        tracking_error = np.std(daily_returns - benchmark_returns) * np.sqrt(trading_days_per_year)
-        information_ratio = excess_return / tracking_error if tracking_error != 0 else np.nan
-    else:
-        excess_return = np.nan
-        tracking_error = np.nan
-        information_ratio = np.nan
-
-    # Skewness and kurtosis
-    skewness = skew(daily_returns)
-    excess_kurtosis = kurtosis(daily_returns)
-
-    # Max drawdown
-    max_drawdown = np.max(np.maximum.accumulate(equity) - equity) / np.maximum.accumulate(equity).max()
-
-    # Calmar Ratio
-    calmar_ratio = annualized_mean / max_drawdown if max_drawdown != 0 else np.nan
-
-    # CAGR
-    cagr = (equity[-1] / equity[0]) ** (trading_days_per_year / len(daily_returns)) - 1
-
-    metrics = {
-        "Sharpe Ratio": sharpe_ratio,
-        "Sortino Ratio": sortino_ratio,
-        "Omega Ratio": omega_ratio,
-        "Alpha": alpha,
-        "Beta": beta,
-        "Information Ratio": information_ratio,
-        "Calmar Ratio": calmar_ratio,
-        "Excess Return (Alpha)": excess_return,
-        "Tracking Error": tracking_error,
-        "Mean Return (Daily)": mean_return,
-        "Standard Deviation (Daily)": std_dev,
-        "Skewness": skewness,
-        "Excess Kurtosis": excess_kurtosis,
-        "Max Drawdown": max_drawdown,
-        "CAGR (Annualized Return)": cagr,
-        "Mean Positive Return (Daily)": mean_positive,
-        "Standard Deviation Positive Returns (Daily)": std_positive,
-        "Mean Negative Return (Daily)": mean_negative,
-        "Standard Deviation Negative Returns (Daily)": std_negative,
+    # The sheet is parsed once into a shared columnar dataset (refreshed in the background once
+    # older than 600s), so switching assets is a column lookup returning a read-only float64 array
+    with stage("get_data", sheet=sheet_name, column=print_data):
+        return data_source().load_dataset(sheet_name).column(print_data)
+
+
+def get_dates_1(sheet_name):
+    # Dates of the sheet rows, used to align the uploaded TPI with the returns
+    return data_source().load_dataset(sheet_name).dates
+
+
+@cached_stage("calculate_equities", cached_arrays(ttl=600))
+def calculate_equities(daily_returns, tpi_data, long_threshold, short_threshold, **position_options):
+    return backtest.calculate_equities(daily_returns, tpi_data, long_threshold, short_threshold, **position_options)
+
+
+@cached_stage("sweep_thresholds", cached_arrays(ttl=600))
+def sweep_thresholds(daily_returns, tpi_data, long_thresholds, short_thresholds, **position_options):
+    return backtest.sweep_thresholds(daily_returns, tpi_data, long_thresholds, short_thresholds, **position_options)
+
+
+@cached_stage("bootstrap_metrics", st.cache_data(ttl=600))
+def bootstrap_significance(daily_returns, tpi_data, long_threshold, short_threshold, block_length, **position_options):
+    # Fixed seed so a rerun shows the same intervals
+    return bootstrap_metrics(daily_returns, tpi_data, long_threshold, short_threshold, block_length=block_length, seed=0, **position_options)
+
+
+@cached_stage("evaluate_signals", cached_arrays(ttl=600))
+def evaluate_tpis(daily_returns, signals, names, long_threshold, short_threshold, **position_options):
+    return evaluate_signals(daily_returns, signals, long_threshold, short_threshold, names=names, **position_options)
+
+
+@cached_stage("ensemble_search", st.cache_data(ttl=600))
+def search_ensemble(daily_returns, signals, names, long_threshold, short_threshold, metric, **position_options):
+    # Fixed seed so a rerun finds the same weights
+    return ensemble_search(daily_returns, signals, long_threshold, short_threshold, metric=metric, names=names, seed=0, **position_options)
+
+
+def plot_rolling_metrics(dates, rolling_by_curve, window):
+    """
+    Builds a figure with one row per rolling metric and one trace per equity curve.
+    """
+    metric_names = ["Sharpe Ratio", "Sortino Ratio", "Beta", "Max Drawdown"]
+    fig = make_subplots(rows=len(metric_names), cols=1, shared_xaxes=True, vertical_spacing=0.04, subplot_titles=metric_names)
+    colors = px.colors.qualitative.Plotly
+
+    for color, (curve_name, rolling) in zip(colors, rolling_by_curve.items()):
+        for row, metric_name in enumerate(metric_names, start=1):
+            fig.add_trace(decimated_scatter(
+                dates, rolling[metric_name][1:],
+                mode='lines',
+                name=curve_name,
+                legendgroup=curve_name,
+                showlegend=row == 1,
+                line=dict(color=color),
+            ), row=row, col=1)
+
+    fig.update_layout(
+        title=f"Rolling Metrics ({window}-Bar Window)",
+        height=900,
+        legend_title="Equity Curves",
+    )
+    return fig
+
+
+def plot_underwater(dates, equities):
+    """
+    Builds the underwater chart: each curve's drawdown from its running peak over time.
+    """
+    fig = go.Figure()
+    for name, equity in equities.items():
+        depth = underwater(equity)[1:]
+        fig.add_trace(decimated_scatter(dates, depth, keep=[int(np.argmin(depth))], mode='lines', name=name, fill='tozeroy'))
+    fig.update_layout(
+        title="Drawdown from Peak (Underwater)",
+        xaxis_title="Date",
+        yaxis_title="Drawdown",
+        yaxis_tickformat=".0%",
+        legend_title="Equity Curves",
+    )
+    return fig
+
+
+def plot_asset_equities(dates, equities, columns=4):
+    """
+    Builds small-multiple log-scale equity charts, one panel per asset.
+    """
+    rows = -(-len(equities) // columns)
+    fig = make_subplots(rows=rows, cols=columns, shared_xaxes=True, subplot_titles=list(equities))
+
+    for i, (asset, (strategy_equity, buy_and_hold_equity, _)) in enumerate(equities.items()):
+        row, col = divmod(i, columns)
+        # Each panel is a fraction of the chart width, so it gets the same fraction of the point budget
+        fig.add_trace(decimated_scatter(dates, strategy_equity[1:], max_points=DEFAULT_MAX_POINTS // columns, keep=drawdown_extremes(strategy_equity[1:]),
+                                        mode='lines', name='Strategy Equity', legendgroup='strategy', showlegend=i == 0, line=dict(color='#636EFA')),
+                      row=row + 1, col=col + 1)
+        fig.add_trace(decimated_scatter(dates, buy_and_hold_equity[1:], max_points=DEFAULT_MAX_POINTS // columns, keep=drawdown_extremes(buy_and_hold_equity[1:]),
+                                        mode='lines', name='Buy and Hold Equity', legendgroup='bah', showlegend=i == 0, line=dict(color='#00CC96')),
+                      row=row + 1, col=col + 1)
+
+    fig.update_yaxes(type='log')
+    fig.update_layout(title="Strategy Equity vs. Buy and Hold per Asset (Log Scale)", height=300 * rows, legend_title="Equity Curves")
+    return fig
+
+
+def display_tpi_comparison(dates, metrics, equity, correlation):
+    """
+    Shows the equity curves, metrics and strategy correlations of several TPIs backtested together.
+    """
+    fig = go.Figure()
+    for name, curve in zip(metrics.columns, equity):
+        fig.add_trace(decimated_scatter(dates, curve[1:], keep=drawdown_extremes(curve[1:]), mode='lines', name=str(name)))
+    fig.update_layout(title="Strategy Equity per TPI (Log Scale)", xaxis_title="Date", yaxis_title="Equity", yaxis_type='log', legend_title="TPIs")
+    st.plotly_chart(fig, use_container_width=True)
+
+    col1m, col2m = st.columns([1, 1])
+    with col1m:
+        st.header("Performance Metrics per TPI")
+        st.dataframe(metrics.style.format("{:.4f}"), height=700)
+    with col2m:
+        # Correlation of the strategies' daily returns, low values diversify an ensemble
+        st.header("Strategy Correlation")
+        fig = px.imshow(correlation, zmin=-1, zmax=1, color_continuous_scale="RdBu_r", text_auto=".2f" if len(correlation) <= 12 else False)
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def display_threshold_sweep(sweep_results, long_thresholds, short_thresholds):
+    """
+    Shows heatmaps of the sweep metrics and the best threshold pairs.
+    """
+    colorscales = {
+        "Sharpe Ratio": "Viridis",
+        "Sortino Ratio": "Viridis",
+        "Max Drawdown": "Viridis_r",  # Lower is better
     }
 
-    return metrics
+    heatmap_cols = st.columns(len(colorscales))
+    for col, (name, colorscale) in zip(heatmap_cols, colorscales.items()):
+        fig = go.Figure(go.Heatmap(
+            z=sweep_results[name],
+            x=short_thresholds,
+            y=long_thresholds,
+            colorscale=colorscale,
+            hovertemplate="Long: %{y:.2f}<br>Short: %{x:.2f}<br>" + name + ": %{z:.4f}<extra></extra>",
+        ))
+        fig.update_layout(
+            title=name,
+            xaxis_title="Short Threshold",
+            yaxis_title="Long Threshold",
+        )
+        with col:
+            st.plotly_chart(fig, use_container_width=True)
+
+    # Table of the best pairs ranked by Sharpe Ratio
+    long_grid, short_grid = np.meshgrid(long_thresholds, short_thresholds, indexing='ij')
+    ranking = pd.DataFrame({
+        "Long Threshold": long_grid.ravel(),
+        "Short Threshold": short_grid.ravel(),
+        **{name: sweep_results[name].ravel() for name in [*colorscales, "Trades", "Win Rate", "Profit Factor"]},
+    }).sort_values("Sharpe Ratio", ascending=False)
+
+    st.header("Best Threshold Pairs")
+    st.dataframe(ranking.head(20).style.format("{:.4f}"), hide_index=True)
 
 
 def display_metric_explanations():
@@ -173,6 +220,8 @@ def display_metric_explanations():
         "Skewness",
         "Excess Kurtosis",
         "Max Drawdown",
+        "Max Drawdown Duration",
+        "Time Under Water",
         "CAGR (Annualized Return)",
         "Mean Positive Return (Daily)",
         "Standard Deviation Positive Returns (Daily)",
@@ -195,6 +244,8 @@ def display_metric_explanations():
         "Describes the asymmetry in the distribution of returns. Positive skewness indicates a longer tail on the right (higher gains), while negative skewness reflects a longer tail on the left (higher losses). Interpretation: Higher is generally better as it suggests higher upside potential.",
         "Measures the tendency of return distributions to have tails heavier or lighter than the normal distribution. High excess kurtosis suggests a higher probability of extreme outcomes. Interpretation: Lower is better as it indicates fewer extreme risk events.",
         "The largest peak-to-trough decline in the strategy's equity during a specific time period. It highlights the worst-case loss scenario. Interpretation: Lower is better as it indicates less severe losses.",
+        "The longest stretch, in bars, that the strategy's equity spent below its previous peak before making a new high. It shows how long losses can take to recover. Interpretation: Lower is better.",
+        "The share of bars on which the strategy's equity was below its previous peak. Interpretation: Lower is better as the strategy spends less time recovering from losses.",
         "The compounded annual rate of growth of the strategy over a specified time horizon. It accounts for the impact of reinvestment and is a key performance measure for long-term investments. Interpretation: Higher is better.",
         "The average of all daily returns that are positive, providing insight into the magnitude of gains during up days. Interpretation: Higher is better.",
         "The standard deviation of positive daily returns, capturing the volatility of gains when the strategy performs positively. Interpretation: Lower is better for more consistent positive returns.",
@@ -233,38 +284,172 @@ col1a, col2a, col3a = st.columns([4, 2, 4])
 
 # Input for the specific data (daily returns) to use in backtesting
 with col2a:
-    backtest_for = st.selectbox("Backtest For", options=["total", "btc", "eth", "sol", "ethbtc", "solbtc", "soleth", "others.d"])
-    long_thre = st.number_input("Enter Long Threshold", value=0.0, step=0.01, format="%.2f")
-    short_thre = st.number_input("Enter Short Threshold", value=0.0, step=0.01, format="%.2f")
-
-# File upload widget (only accepts CSV files)
-    uploaded_file = st.file_uploader("Upload a CSV file", type="csv")
+    backtest_assets = ["total", "btc", "eth", "sol", "ethbtc", "solbtc", "soleth", "others.d"]
+    backtest_for = st.selectbox("Backtest For", options=backtest_assets)
+    sweep_mode = st.toggle("Threshold Sweep")
+
+    if sweep_mode:
+        # Ranges of thresholds to evaluate, every long/short combination is backtested
+        long_min, long_max = st.slider("Long Threshold Range", -1.0, 1.0, (-1.0, 1.0), step=0.01)
+        short_min, short_max = st.slider("Short Threshold Range", -1.0, 1.0, (-1.0, 1.0), step=0.01)
+        sweep_step = st.number_input("Threshold Step", value=0.05, min_value=0.01, step=0.01, format="%.2f")
+
+        # Walk-forward: fit thresholds in-sample, score them on the following bars
+        walk_forward_mode = st.toggle("Walk-Forward Analysis")
+        if walk_forward_mode:
+            in_sample_bars = st.number_input("In-Sample Bars", value=365, min_value=30, step=30)
+            out_of_sample_bars = st.number_input("Out-of-Sample Bars", value=90, min_value=10, step=10)
+    else:
+        long_thre = st.number_input("Enter Long Threshold", value=0.0, step=0.01, format="%.2f")
+        short_thre = st.number_input("Enter Short Threshold", value=0.0, step=0.01, format="%.2f")
+        all_assets_mode = st.toggle("Backtest All Assets")
+        rolling_window = st.selectbox("Rolling Metrics Window", options=[90, 180, 365])
+        bootstrap_mode = st.toggle("Bootstrap Significance")
+        if bootstrap_mode:
+            bootstrap_block = st.number_input("Bootstrap Block Length (bars)", value=20, min_value=2, step=1)
+        # Only used when several TPIs are uploaded
+        ensemble_mode = st.toggle("Ensemble Search (multiple TPIs)")
+        if ensemble_mode:
+            ensemble_metric = st.selectbox("Optimize Ensemble For", options=["Sharpe Ratio", "Sortino Ratio", "Omega Ratio", "Calmar Ratio", "CAGR (Annualized Return)"])
+
+    # Costs are a percentage of the traded notional, charged on every position change
+    with st.expander("Trading Costs & Position Sizing"):
+        fee_pct = st.number_input("Fee per Trade (%)", value=0.0, min_value=0.0, step=0.01, format="%.3f")
+        slippage_pct = st.number_input("Slippage (%)", value=0.0, min_value=0.0, step=0.01, format="%.3f")
+        sizing = st.selectbox("Position Sizing", options=["threshold", "proportional"],
+                              format_func=lambda s: "Full position past the thresholds" if s == "threshold" else "Sized by the TPI strength")
+        max_leverage = st.number_input("Max Leverage", value=1.0, min_value=0.1, max_value=10.0, step=0.5)
+    position_options = dict(fee=fee_pct / 100, slippage=slippage_pct / 100, sizing=sizing, max_leverage=max_leverage)
+
+    # Picked before the backtest: a widget changed under the results would rerun the page and clear them
+    export_format = st.selectbox("Export format", options=list(FORMATS))
+
+# File upload widget (only accepts CSV files): one TPI per file with a tpi column, or a wide CSV with one TPI per column
+    uploaded_files = st.file_uploader("Upload one or more CSV files", type="csv", accept_multiple_files=True)
 
     backtest_trig = st.button("Perform Backtest")
 
 # Button to perform backtest if conditions are met
 if backtest_trig:
-    if sheet_name and backtest_for and uploaded_file is not None:
+    if sheet_name and backtest_for and uploaded_files:
         try:
             # Fetch data using the get_data_1 function
-            daily_returns_data = get_data_1(sheet_name, backtest_for)
-            daily_returns = pd.Series(daily_returns_data)  # Convert to Pandas Series
-
-            # Read the uploaded CSV file
-            df = pd.read_csv(uploaded_file)
+            daily_returns = get_data_1(sheet_name, backtest_for)
+
+            # Read the date and TPI columns of the uploaded CSV files
+            with stage("read_upload"):
+                # Files sharing a name are suffixed instead of replacing each other
+                names = unique_names([Path(file.name).stem for file in uploaded_files])
+                components, skipped = tpi_components({name: read_tpi_csv(file, columns=None) for name, file in zip(names, uploaded_files)})
+            for name in skipped:
+                st.warning(f"{name}: no 'date' column, the file was left out.")
+
+            # A single TPI goes through the regular backtest, several are compared as one batch
+            df = next(iter(components.values())) if len(components) == 1 else pd.DataFrame()
+
+            # Pair each TPI value with the return of the same date instead of the same row
+            return_dates = get_dates_1(sheet_name)
+            if 'tpi' in df.columns and 'date' in df.columns and len(return_dates):
+                with stage("align"):
+                    alignment = align_tpi(df['date'], df['tpi'], return_dates[:len(daily_returns)])
+                daily_returns = daily_returns[alignment.start:alignment.stop]
+                df = pd.DataFrame({'date': alignment.dates, 'tpi': alignment.tpi})
+                for issue in alignment.issues():
+                    st.warning(issue)
+
+            if len(components) > 1 and sweep_mode:
+                st.error("Threshold sweeps take a single TPI. Turn off Threshold Sweep to compare several TPIs.")
+
+            elif len(components) > 1:
+
+                # Every TPI on the dates they all cover, as one signal matrix (by row without return dates)
+                with stage("align"):
+                    if len(return_dates):
+                        signal_matrix = align_signals(components, return_dates[:len(daily_returns)])
+                    else:
+                        signal_matrix = stack_signals(components, len(daily_returns))
+                for name, issues in signal_matrix.issues.items():
+                    for issue in issues:
+                        st.warning(f"{name}: {issue}")
+                daily_returns = daily_returns[signal_matrix.start:signal_matrix.stop]
+
+                tpi_metrics, tpi_equity, correlation = evaluate_tpis(daily_returns, signal_matrix.signals, signal_matrix.names, long_thre, short_thre, **position_options)
+                with stage("render_chart", chart="tpi_comparison"):
+                    display_tpi_comparison(signal_matrix.dates, tpi_metrics, tpi_equity, correlation)
+
+                if ensemble_mode:
+                    candidates = search_ensemble(daily_returns, signal_matrix.signals, signal_matrix.names, long_thre, short_thre, ensemble_metric, **position_options)
+                    best_weights = candidates[signal_matrix.names].to_numpy()[0]
+
+                    # Best composite against the equal-weight ensemble
+                    composites = np.vstack([best_weights, np.full(len(best_weights), 1 / len(best_weights))]) @ signal_matrix.signals
+                    ensemble_metrics, ensemble_equity, ensemble_correlation = evaluate_tpis(daily_returns, composites, ["Best Ensemble", "Equal Weight"], long_thre, short_thre, **position_options)
+
+                    st.header("Ensemble Search")
+                    st.markdown(f"Weighted averages of the TPIs, searched for the highest {ensemble_metric}. "
+                                "Scores are in-sample, so validate the weights on data they were not fitted on.")
+                    with stage("render_chart", chart="ensemble"):
+                        display_tpi_comparison(signal_matrix.dates, ensemble_metrics, ensemble_equity, ensemble_correlation)
+                    st.dataframe(candidates.style.format("{:.4f}"), hide_index=True)
 
             # Ensure 'tpi' and 'date' columns exist in the uploaded CSV file
-            if 'tpi' in df.columns and 'date' in df.columns:
+            elif 'tpi' in df.columns and 'date' in df.columns and sweep_mode:
+
+                # Evaluate the whole threshold grid in one batch
+                long_thresholds = np.round(np.arange(long_min, long_max + sweep_step / 2, sweep_step), 4)
+                short_thresholds = np.round(np.arange(short_min, short_max + sweep_step / 2, sweep_step), 4)
+                sweep_results = sweep_thresholds(daily_returns, df['tpi'], long_thresholds, short_thresholds, **position_options)
+
+                display_threshold_sweep(sweep_results, long_thresholds, short_thresholds)
+
+                if walk_forward_mode:
+                    with stage("walk_forward"):
+                        splits, oos_equity = walk_forward(daily_returns, df['tpi'], long_thresholds, short_thresholds, in_sample_bars, out_of_sample_bars, **position_options)
+
+                    st.header("Walk-Forward Analysis")
+                    if splits.empty:
+                        st.warning("Not enough data for one in-sample and out-of-sample split.")
+                    else:
+                        # Stitched out-of-sample equity starts at the first out-of-sample bar
+                        oos_start = splits["Out-of-Sample Start"].iloc[0]
+                        fig = go.Figure(decimated_scatter(df['date'].iloc[oos_start:oos_start + len(oos_equity) - 1], oos_equity[1:], keep=drawdown_extremes(oos_equity[1:]),
+                                                          mode='lines', name='Out-of-Sample Equity'))
+                        fig.update_layout(title="Walk-Forward Out-of-Sample Strategy Equity", xaxis_title="Date", yaxis_title="Equity")
+                        st.plotly_chart(fig)
+                        st.dataframe(splits, hide_index=True)
+
+            elif 'tpi' in df.columns and 'date' in df.columns and all_assets_mode:
+
+                # Same TPI and thresholds on every market, scored in one batch
+                returns_by_asset = {asset: get_data_1(sheet_name, asset) for asset in backtest_assets}
+                if len(return_dates):
+                    returns_by_asset = {asset: returns[alignment.start:alignment.stop] for asset, returns in returns_by_asset.items()}
+                with stage("backtest_all_assets"):
+                    asset_metrics, asset_equities = backtest_all_assets(returns_by_asset, df['tpi'], long_thre, short_thre, **position_options)
+
+                with stage("render_chart", chart="asset_equities"):
+                    st.plotly_chart(plot_asset_equities(df['date'], asset_equities), use_container_width=True)
+
+                col1b, col2b = st.columns([1,1])
+
+                with col1b:
+                    st.header("Strategy Metrics per Asset")
+                    st.dataframe(asset_metrics.style.format("{:.4f}"), height = 700)
+                with col2b:
+                    st.header("Metric Explanations")
+                    display_metric_explanations()
+
+            elif 'tpi' in df.columns and 'date' in df.columns:
 
                 # Calculate and cache the equities
-                strategy_equity, buy_and_hold_equity, long_only_equity = calculate_equities(daily_returns, df['tpi'], long_thre, short_thre)
+                strategy_equity, buy_and_hold_equity, long_only_equity = calculate_equities(daily_returns, df['tpi'], long_thre, short_thre, **position_options)
 
                 # Function to plot the equity chart
                 def plot_equity_chart(yaxis_type='linear', title_suffix=''):
                     fig = go.Figure()
-                    fig.add_trace(go.Scatter(x=df['date'], y=strategy_equity[1:], mode='lines', name='Strategy Equity'))
-                    fig.add_trace(go.Scatter(x=df['date'], y=long_only_equity[1:], mode='lines', name='Long-Only Equity'))
-                    fig.add_trace(go.Scatter(x=df['date'], y=buy_and_hold_equity[1:], mode='lines', name='Buy and Hold Equity'))
+                    # Traces are decimated for the browser, keeping each curve's max drawdown peak and trough
+                    for equity, name in [(strategy_equity, 'Strategy Equity'), (long_only_equity, 'Long-Only Equity'), (buy_and_hold_equity, 'Buy and Hold Equity')]:
+                        fig.add_trace(decimated_scatter(df['date'], equity[1:], keep=drawdown_extremes(equity[1:]), mode='lines', name=name))
 
                     # Customize layout with adjustable y-axis type
                     fig.update_layout(
@@ -277,13 +462,35 @@ if backtest_trig:
                     return fig
 
                 # Display both charts side by side
-                st.plotly_chart(plot_equity_chart(yaxis_type="linear", title_suffix="(Linear Scale)"))
-                st.plotly_chart(plot_equity_chart(yaxis_type='log', title_suffix="(Log Scale)"))
-
-                # Calculate metrics for both strategies and include alpha
-                bah_metrics = calculate_metrics(buy_and_hold_equity)
-                long_metrics = calculate_metrics(long_only_equity, benchmark_equity=buy_and_hold_equity)
-                strat_metrics = calculate_metrics(strategy_equity, benchmark_equity=buy_and_hold_equity)
+                with stage("render_chart", chart="equity"):
+                    st.plotly_chart(plot_equity_chart(yaxis_type="linear", title_suffix="(Linear Scale)"))
+                    st.plotly_chart(plot_equity_chart(yaxis_type='log', title_suffix="(Log Scale)"))
+
+                # Underwater curves and the deepest strategy drawdowns under the equity charts
+                with stage("drawdowns"):
+                    equity_dates = np.concatenate([df['date'].to_numpy()[:1], df['date'].to_numpy()])
+                    top_drawdowns = drawdown_episodes(strategy_equity, dates=equity_dates, top=5)
+                with stage("render_chart", chart="underwater"):
+                    st.plotly_chart(plot_underwater(df['date'], {"Strategy": strategy_equity, "Long-Only": long_only_equity, "Buy and Hold": buy_and_hold_equity}))
+                st.header("Largest Strategy Drawdowns")
+                st.dataframe(top_drawdowns.style.format({"Depth": "{:.2%}"}), hide_index=True)
+
+                # Rolling metrics under the equity charts, beta against buy-and-hold
+                with stage("rolling_metrics"):
+                    rolling_by_curve = {
+                        "Strategy": calculate_rolling_metrics(strategy_equity, rolling_window, benchmark_equity=buy_and_hold_equity),
+                        "Long-Only": calculate_rolling_metrics(long_only_equity, rolling_window, benchmark_equity=buy_and_hold_equity),
+                        "Buy and Hold": calculate_rolling_metrics(buy_and_hold_equity, rolling_window, benchmark_equity=buy_and_hold_equity),
+                    }
+                with stage("render_chart", chart="rolling_metrics"):
+                    st.plotly_chart(plot_rolling_metrics(df['date'], rolling_by_curve, rolling_window))
+
+                # Calculate metrics for both strategies in one batch and include alpha
+                with stage("metrics"):
+                    bah_metrics = calculate_metrics(buy_and_hold_equity)
+                    batch_metrics = calculate_metrics_batch(np.vstack([long_only_equity, strategy_equity]), benchmark_equity=buy_and_hold_equity)
+                long_metrics = {name: values[0] for name, values in batch_metrics.items()}
+                strat_metrics = {name: values[1] for name, values in batch_metrics.items()}
 
                 # Create DataFrames for metrics
                 bah_df = pd.DataFrame.from_dict(bah_metrics, orient='index', columns=['Buy & Hold Metrics'])
@@ -302,6 +509,65 @@ if backtest_trig:
                     st.header("Metric Explanations")
                     display_metric_explanations()
 
+                # Every strategy trade from the TPI position changes, with aggregate statistics
+                with stage("trades"):
+                    positions = backtest.tpi_positions(df['tpi'], long_thre, short_thre)
+                    ledger = trade_ledger(positions, strategy_equity, dates=df['date'])
+                    trade_stats = pd.DataFrame.from_dict(trade_statistics(positions, strategy_equity), orient='index', columns=['Strategy Trades'])
+
+                col1t, col2t = st.columns([1, 2])
+                with col1t:
+                    st.header("Trade Statistics")
+                    st.dataframe(trade_stats.style.format("{:.4f}"))
+                with col2t:
+                    st.header("Trade Ledger")
+                    st.dataframe(ledger.style.format({"Return": "{:.2%}"}), hide_index=True, height=400)
+
+                # Equity curves, metrics and trades for download, serialized only when a button is clicked
+                def equity_frame():
+                    n = min(len(df), len(strategy_equity) - 1)
+                    return pd.DataFrame({
+                        "Date": df['date'].to_numpy()[:n],
+                        "Strategy Equity": strategy_equity[1:n + 1],
+                        "Long-Only Equity": long_only_equity[1:n + 1],
+                        "Buy and Hold Equity": buy_and_hold_equity[1:n + 1],
+                    })
+
+                # on_click="ignore" keeps the results on screen, a rerun would clear them
+                col1c, col2c, col3c = st.columns([1, 1, 1])
+                with col1c:
+                    st.download_button(
+                        label=f"Download equity curves as {export_format}",
+                        data=deferred_export(equity_frame, export_format),
+                        file_name=file_name("tpi_equity", export_format),
+                        mime=mime_type(export_format),
+                        on_click="ignore",
+                    )
+                with col2c:
+                    st.download_button(
+                        label=f"Download metrics as {export_format}",
+                        data=deferred_export(lambda: pd.concat([combined_metrics, trade_stats.set_axis(["Strategy Metrics"], axis=1)]).rename_axis("Metric").reset_index(), export_format),
+                        file_name=file_name("tpi_metrics", export_format),
+                        mime=mime_type(export_format),
+                        on_click="ignore",
+                    )
+                with col3c:
+                    st.download_button(
+                        label=f"Download trades as {export_format}",
+                        data=deferred_export(lambda: ledger, export_format),
+                        file_name=file_name("tpi_trades", export_format),
+                        mime=mime_type(export_format),
+                        on_click="ignore",
+                    )
+
+                if bootstrap_mode:
+                    # 10,000 stationary block-bootstrap resamples of the returns and positions
+                    significance = bootstrap_significance(daily_returns, df['tpi'], long_thre, short_thre, bootstrap_block, **position_options)
+                    st.header("Bootstrap Significance")
+                    st.markdown("95% confidence intervals of the strategy metrics and of their difference to buy-and-hold. "
+                                "The p-value is the share of resamples in which the strategy did not beat buy-and-hold.")
+                    st.dataframe(significance.style.format("{:.4f}"))
+
 
 
             else:
@@ -310,3 +576,8 @@ if backtest_trig:
             st.error(f"Error fetching data or processing backtest: {e}")
     else:
         st.warning("Please enter the sheet name, key for daily returns, and upload a CSV file.")
+
+if diagnostics.enabled():
+    with st.expander("Diagnostics"):
+        st.dataframe(pd.DataFrame(diagnostics.records()), hide_index=True)
+        st.dataframe(pd.DataFrame([shared_cache.stats()]), hide_index=True)
@@ -0,0 +1,273 @@
+"""Persistent on-disk cache for the Google Apps Script sheet endpoints.
+
+Each (endpoint, sheet) pair is stored as a Parquet file with one typed column per key of the
+sheet's JSON payload. Reads are served from memory or disk right away; once the cached copy is
+older than `max_age` a background thread fetches only the rows from the last cached date onward
+and appends them, so the full-sheet download never sits in the request path and the cache
+survives process restarts.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_client
+from diagnostics import stage
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("TRW_CACHE_DIR", Path(__file__).resolve().parent / ".cache"))
+DATE_COLUMN = "date"
+
+_frames = {}  # Cache path -> (DataFrame, time of the last refresh)
+_datasets = {}  # (cache path, trim, derive) -> (DataFrame it was built from, SheetDataset)
+_refreshing = set()  # Cache paths with a refresh in flight
+_prefetched = set()  # Cache paths already handed to prefetch()
+_lock = threading.Lock()
+
+
+def _cache_path(endpoint, sheet_name):
+    """Parquet file for an endpoint and sheet, keyed by a short hash of the endpoint URL."""
+    endpoint_key = hashlib.sha1(endpoint.encode()).hexdigest()[:12]
+    return CACHE_DIR / f"{endpoint_key}_{sheet_name}.parquet"
+
+
+def payload_to_frame(data):
+    """Convert a sheet JSON payload (dict of column lists) to a typed DataFrame.
+
+    Columns of different lengths are padded with NaN, the date column is parsed to datetime64
+    and every other column is converted to float64.
+    """
+    return typed_frame(pd.DataFrame({key: pd.Series(values) for key, values in data.items()}))
+
+
+def typed_frame(frame):
+    """Parse the date column of a sheet frame to datetime64 and every other column to float64, in place."""
+    for column in frame.columns:
+        if column == DATE_COLUMN:
+            frame[column] = pd.to_datetime(frame[column], errors="coerce")
+        else:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    return frame
+
+
+def fetch_sheet(endpoint, sheet_name, since=None):
+    """Fetch a sheet from the Apps Script endpoint, optionally only from the `since` date onward.
+
+    Endpoints that ignore the `since` parameter return the whole sheet; rows before `since`
+    are then dropped by the caller. Incremental fetches are conditional requests and return
+    None when the server reports the rows as not modified.
+    """
+    params = {"sheet": sheet_name}
+    if since is not None:
+        params["since"] = since.strftime("%Y-%m-%d")
+    with stage("fetch", sheet=sheet_name):
+        payload = data_client.get_json(endpoint, params=params, conditional=since is not None)
+    if payload is None:
+        return None
+    with stage("parse", sheet=sheet_name):
+        return payload_to_frame(payload)
+
+
+def _merge(cached, fetched):
+    """Append the fetched rows that are new relative to the cached frame."""
+    if DATE_COLUMN in cached.columns and DATE_COLUMN in fetched.columns and cached[DATE_COLUMN].notna().any():
+        # The last cached day may still have been forming, so it is replaced as well
+        last_date = cached[DATE_COLUMN].max()
+        kept = cached[cached[DATE_COLUMN] < last_date]
+        new_rows = fetched[fetched[DATE_COLUMN] >= last_date]
+    else:
+        # Without dates, rows are matched by position
+        kept = cached
+        new_rows = fetched.iloc[len(cached):]
+
+    if new_rows.empty:
+        return cached
+    return pd.concat([kept, new_rows], ignore_index=True)
+
+
+def _write(path, frame):
+    """Write the frame atomically so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    frame.to_parquet(temporary, index=False)
+    os.replace(temporary, path)
+
+
+def _refresh(endpoint, sheet_name, path):
+    """Fetch new rows, append them to the cache and store the result on disk."""
+    try:
+        cached, _ = _frames[path]
+        since = cached[DATE_COLUMN].max() if DATE_COLUMN in cached.columns else None
+        fetched = fetch_sheet(endpoint, sheet_name, since=since if pd.notna(since) else None)
+        merged = cached if fetched is None else _merge(cached, fetched)
+        if merged is not cached:
+            _write(path, merged)
+        with _lock:
+            _frames[path] = (merged, time.time())
+    except Exception as e:
+        # Keep serving the stale copy and retry once it is max_age old again
+        logger.warning("Refreshing %s failed: %s", path.name, e)
+        with _lock:
+            _frames[path] = (_frames[path][0], time.time())
+    finally:
+        with _lock:
+            _refreshing.discard(path)
+
+
+def load_sheet(endpoint, sheet_name, max_age=600):
+    """Return the sheet as a DataFrame, serving cached data immediately.
+
+    The first call without a cache on disk fetches the sheet synchronously. Afterwards data older
+    than `max_age` seconds is still returned right away while a background refresh appends any
+    newer rows.
+    """
+    path = _cache_path(endpoint, sheet_name)
+
+    with _lock:
+        entry = _frames.get(path)
+    if entry is None and path.exists():
+        with stage("read_cache", sheet=sheet_name):
+            entry = (pd.read_parquet(path), path.stat().st_mtime)
+        with _lock:
+            _frames[path] = entry
+
+    if entry is None:
+        frame = fetch_sheet(endpoint, sheet_name)
+        _write(path, frame)
+        with _lock:
+            _frames[path] = (frame, time.time())
+        return frame
+
+    frame, refreshed_at = entry
+    if time.time() - refreshed_at > max_age:
+        with _lock:
+            start = path not in _refreshing
+            _refreshing.add(path)
+        if start:
+            threading.Thread(target=_refresh, args=(endpoint, sheet_name, path), daemon=True).start()
+
+    return frame
+
+
+def prefetch(sheets, max_workers=4):
+    """Load several (endpoint, sheet_name) pairs concurrently in the background.
+
+    Used at app start so the sheets of the other pages are already cached when they are opened.
+    Each sheet is prefetched at most once per process, so pages can call this on every run.
+    Failures are logged and otherwise ignored; the page that needs the sheet will retry.
+    """
+    with _lock:
+        sheets = [(endpoint, sheet_name) for endpoint, sheet_name in sheets
+                  if _cache_path(endpoint, sheet_name) not in _prefetched | set(_frames)]
+        _prefetched.update(_cache_path(endpoint, sheet_name) for endpoint, sheet_name in sheets)
+    if not sheets:
+        return
+
+    def load(endpoint, sheet_name):
+        try:
+            load_sheet(endpoint, sheet_name)
+        except Exception as e:
+            logger.warning("Prefetching %s failed: %s", sheet_name, e)
+
+    def run():
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for endpoint, sheet_name in sheets:
+                pool.submit(load, endpoint, sheet_name)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+@dataclass(frozen=True)
+class SheetDataset:
+    """Immutable columnar view of a sheet: a datetime64 index and one read-only float64 array per column.
+
+    By default each column is trimmed to its last valid value, so columns shorter than the sheet
+    keep their original length. Looking up a column returns a view, not a copy. Values built from
+    the dataset (e.g. an export) can be memoized with derived().
+    """
+    dates: np.ndarray
+    columns: dict
+    memo: dict = field(default_factory=dict, compare=False, repr=False)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def __getitem__(self, name):
+        # Same keys as the sheet payload, 'date' gives the index
+        return self.dates if name == DATE_COLUMN else self.columns[name]
+
+    def derived(self, name, build):
+        """Return build() computed once for this dataset version and stored under name."""
+        if name not in self.memo:
+            self.memo[name] = build()
+        return self.memo[name]
+
+
+def _read_only(values):
+    values = np.ascontiguousarray(values, dtype="float64")
+    values.flags.writeable = False
+    return values
+
+
+def frame_to_dataset(frame, trim=True, derive=None):
+    """Build a SheetDataset from a typed sheet DataFrame.
+
+    With trim=False every column keeps the length of the date index. derive, if given, maps the
+    columns dict to extra columns (e.g. spreads) that are computed once and stored alongside.
+    """
+    if DATE_COLUMN in frame.columns:
+        dates = frame[DATE_COLUMN].to_numpy(dtype="datetime64[ns]")
+    else:
+        dates = np.array([], dtype="datetime64[ns]")
+    arrays = {name: frame[name].to_numpy(dtype="float64") for name in frame.columns.drop(DATE_COLUMN, errors="ignore")}
+    return arrays_to_dataset(dates, arrays, trim=trim, derive=derive)
+
+
+def arrays_to_dataset(dates, arrays, trim=True, derive=None):
+    """Build a SheetDataset from a datetime64 index and a dict of float64 arrays, as frame_to_dataset.
+
+    Arrays that already are contiguous float64 (e.g. memory-mapped Arrow columns) are used
+    without a copy.
+    """
+    dates.flags.writeable = False
+
+    columns = {}
+    for name, values in arrays.items():
+        if trim:
+            valid = np.flatnonzero(~np.isnan(values))
+            values = values[:valid[-1] + 1] if len(valid) else values[:0]
+        columns[name] = _read_only(values)
+
+    if derive is not None:
+        columns.update({name: _read_only(values) for name, values in derive(columns).items()})
+
+    return SheetDataset(dates=dates, columns=columns)
+
+
+def load_dataset(endpoint, sheet_name, max_age=600, trim=True, derive=None):
+    """Return the sheet as a SheetDataset shared by every key and session of the process.
+
+    The dataset is parsed once per version of the cached sheet and rebuilt only after a refresh
+    replaced the underlying frame. derive must be a module-level function so it is the same
+    object on every rerun.
+    """
+    frame = load_sheet(endpoint, sheet_name, max_age=max_age)
+    key = (_cache_path(endpoint, sheet_name), trim, derive)
+    with _lock:
+        entry = _datasets.get(key)
+    if entry is not None and entry[0] is frame:
+        return entry[1]
+
+    with stage("build_dataset", sheet=sheet_name):
+        dataset = frame_to_dataset(frame, trim=trim, derive=derive)
+    with _lock:
+        _datasets[key] = (frame, dataset)
+    return dataset
@@ -0,0 +1,108 @@
+"""Block-bootstrap significance of the TPI strategy metrics against buy-and-hold.
+
+Pairs of per-bar strategy and buy-and-hold growth (the daily return under the TPI exposure, net of
+trading costs) are resampled in blocks, which keeps the short-range autocorrelation of both
+series and their alignment. Every resample becomes one row of a 2D array
+of strategy and buy-and-hold equity curves, scored in one calculate_metrics_batch call per chunk.
+"""
+import numpy as np
+import pandas as pd
+
+from backtest import calculate_metrics, calculate_metrics_batch, position_growth, tpi_exposure
+
+# Metrics tested against buy-and-hold, with True where a lower value is better
+TESTED_METRICS = {
+    "Sharpe Ratio": False,
+    "Sortino Ratio": False,
+    "Omega Ratio": False,
+    "CAGR (Annualized Return)": False,
+    "Max Drawdown": True,
+}
+
+
+def block_bootstrap_indices(n, n_resamples, block_length, method="stationary", rng=None):
+    """Resampled positions 0..n-1, one row per resample, built from blocks that wrap around the end.
+
+    "fixed" uses blocks of exactly block_length bars. "stationary" (Politis and Romano) draws
+    geometric block lengths with mean block_length, so the resampled series stays stationary.
+    """
+    rng = np.random.default_rng(rng)
+    steps = np.arange(n)
+
+    if method == "fixed":
+        starts = rng.integers(0, n, (n_resamples, -(-n // block_length)))
+        block = steps // block_length
+        return (starts[:, block] + steps % block_length) % n
+    if method != "stationary":
+        raise ValueError(f"Unknown bootstrap method: {method}")
+
+    # A new block starts with probability 1 / block_length at every bar
+    new_block = rng.random((n_resamples, n)) < 1 / block_length
+    new_block[:, 0] = True
+    block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    starts = rng.integers(0, n, (n_resamples, n))
+    return (np.take_along_axis(starts, block_start, axis=1) + steps - block_start) % n
+
+
+def _equities(growth):
+    """Equity curves starting at 1 from per-bar growth factors, one row per curve."""
+    equity = np.ones((growth.shape[0], growth.shape[1] + 1))
+    np.cumprod(growth, axis=1, out=equity[:, 1:])
+    return equity
+
+
+def bootstrap_metrics(daily_returns, tpi_data, long_threshold, short_threshold, n_resamples=10_000,
+                      block_length=20, method="stationary", confidence=0.95, chunk_size=1000, seed=None,
+                      **position_options):
+    """Confidence intervals and p-values of the strategy metrics against buy-and-hold.
+
+    Returns a table with one row per tested metric: the observed strategy and buy-and-hold values,
+    the bootstrap confidence interval of the strategy metric and of its difference to buy-and-hold,
+    and the one-sided p-value of the strategy not beating buy-and-hold. chunk_size bounds how many
+    resamples are held in memory at once. position_options (costs, sizing, leverage) work as in
+    calculate_equities.
+    """
+    fee, slippage = position_options.pop("fee", 0.0), position_options.pop("slippage", 0.0)
+    exposure = tpi_exposure(tpi_data, long_threshold, short_threshold, **position_options)
+    returns = np.asarray(daily_returns, dtype=float)
+    n = min(len(returns), len(exposure))
+    strategy_growth = position_growth(returns[:n], exposure[:n], fee=fee, slippage=slippage)
+    buy_and_hold_growth = position_growth(returns[:n], np.ones(n), fee=fee, slippage=slippage)
+
+    rng = np.random.default_rng(seed)
+    strategy_values = {name: [] for name in TESTED_METRICS}
+    buy_and_hold_values = {name: [] for name in TESTED_METRICS}
+
+    for start in range(0, n_resamples, chunk_size):
+        indices = block_bootstrap_indices(n, min(chunk_size, n_resamples - start), block_length, method, rng)
+        strategy = _equities(strategy_growth[indices])
+        buy_and_hold = _equities(buy_and_hold_growth[indices])
+
+        # Strategy and buy-and-hold rows scored together; the tested metrics need no benchmark
+        metrics = calculate_metrics_batch(np.vstack([strategy, buy_and_hold]))
+        for name in TESTED_METRICS:
+            strategy_values[name].append(metrics[name][:len(indices)])
+            buy_and_hold_values[name].append(metrics[name][len(indices):])
+
+    observed_strategy = calculate_metrics(_equities(strategy_growth[None, :])[0])
+    observed_buy_and_hold = calculate_metrics(_equities(buy_and_hold_growth[None, :])[0])
+    tail = (1 - confidence) / 2 * 100
+
+    rows = {}
+    for name, lower_is_better in TESTED_METRICS.items():
+        strategy = np.concatenate(strategy_values[name])
+        difference = strategy - np.concatenate(buy_and_hold_values[name])
+        # Share of resamples where the strategy did not beat buy-and-hold
+        not_better = difference >= 0 if lower_is_better else difference <= 0
+        valid = ~np.isnan(difference)
+        rows[name] = {
+            "Strategy": observed_strategy[name],
+            "Buy & Hold": observed_buy_and_hold[name],
+            "CI Low": np.nanpercentile(strategy, tail),
+            "CI High": np.nanpercentile(strategy, 100 - tail),
+            "Difference CI Low": np.nanpercentile(difference, tail),
+            "Difference CI High": np.nanpercentile(difference, 100 - tail),
+            "p-value": (1 + (not_better & valid).sum()) / (1 + valid.sum()),
+        }
+
+    return pd.DataFrame.from_dict(rows, orient="index")
@@ -0,0 +1,60 @@
+"""TPI dates are matched to the return dates by calendar day."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from backtest import align_tpi  # noqa: E402
+from ensemble import align_signals, stack_signals  # noqa: E402
+
+DAYS = pd.date_range("2024-01-01", periods=10)
+
+
+def sheet_dates():
+    # Sheet dates carry a time of day in UTC, uploaded TPIs are plain YYYY-MM-DD dates
+    return pd.to_datetime(pd.Series(DAYS.strftime("%Y-%m-%dT05:00:00Z")))
+
+
+def test_align_tpi_matches_dates_with_a_time_of_day():
+    alignment = align_tpi(pd.to_datetime(pd.Series(DAYS.strftime("%Y-%m-%d"))), np.arange(10.0), sheet_dates())
+    assert (alignment.start, alignment.stop) == (0, 10)
+    np.testing.assert_array_equal(alignment.tpi, np.arange(10.0))
+    assert alignment.issues() == []
+
+
+def test_align_tpi_reports_gaps_by_day():
+    alignment = align_tpi(DAYS.delete(4), np.arange(9.0), sheet_dates())
+    np.testing.assert_array_equal(alignment.tpi, [0, 1, 2, 3, 3, 4, 5, 6, 7, 8])
+    assert alignment.issues() == ["1 missing TPI dates (previous value carried forward): 2024-01-05"]
+
+
+def test_align_tpi_without_return_dates():
+    with pytest.raises(ValueError, match="no dates"):
+        align_tpi(DAYS, np.arange(10.0), np.array([], dtype="datetime64[ns]"))
+
+
+def test_align_tpi_without_parseable_dates():
+    tpi_dates = pd.to_datetime(pd.Series(["not a date", None, ""]), errors="coerce")
+    with pytest.raises(ValueError, match="no parseable dates"):
+        align_tpi(tpi_dates, np.arange(3.0), sheet_dates())
+
+
+def test_align_signals_matches_dates_with_a_time_of_day():
+    components = {"a": pd.DataFrame({"date": DAYS, "tpi": np.arange(10.0)}),
+                  "b": pd.DataFrame({"date": DAYS[2:], "tpi": -np.arange(8.0)})}
+    signal_matrix = align_signals(components, sheet_dates())
+    assert (signal_matrix.start, signal_matrix.stop) == (2, 10)
+    np.testing.assert_array_equal(signal_matrix.signals, [np.arange(2.0, 10.0), -np.arange(8.0)])
+    assert all(issues == [] for issues in signal_matrix.issues.values())
+
+
+def test_stack_signals_pairs_rows_by_position():
+    components = {"a": pd.DataFrame({"date": DAYS, "tpi": np.arange(10.0)}),
+                  "b": pd.DataFrame({"date": DAYS[:6], "tpi": -np.arange(6.0)})}
+    signal_matrix = stack_signals(components, 8)
+    assert (signal_matrix.start, signal_matrix.stop) == (0, 6)
+    np.testing.assert_array_equal(signal_matrix.signals, [np.arange(6.0), -np.arange(6.0)])
@@ -0,0 +1,30 @@
+"""Position sizing of thresholded TPIs."""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from backtest import calculate_equities, tpi_exposure  # noqa: E402
+
+
+def test_proportional_exposure_follows_the_threshold_side():
+    tpi = np.array([-1.5, -0.5, -0.2, 0.0, 0.3, 2.0])
+    # A long threshold below zero holds longs at negative TPI values
+    exposure = tpi_exposure(tpi, -0.6, -1.0, sizing="proportional", max_leverage=2.0)
+    np.testing.assert_allclose(exposure, [-2.0, 1.0, 0.4, 0.0, 0.6, 2.0])
+
+
+def test_proportional_exposure_is_neutral_on_a_missing_tpi():
+    tpi = np.array([0.5, 0.8, np.nan, 0.6, -0.4])
+    exposure = tpi_exposure(tpi, 0.0, 0.0, sizing="proportional")
+    np.testing.assert_allclose(exposure, [0.5, 0.8, 0.0, 0.6, -0.4])
+
+    strategy_equity = calculate_equities(np.full(5, 0.01), tpi, 0.0, 0.0, sizing="proportional")[0]
+    assert np.isfinite(strategy_equity).all()
+
+
+def test_threshold_exposure():
+    exposure = tpi_exposure(np.array([-0.5, 0.0, 0.5]), 0.1, -0.1, max_leverage=1.5)
+    np.testing.assert_allclose(exposure, [-1.5, 0.0, 1.5])
@@ -0,0 +1,80 @@
+"""BreadthState replays must match compute_breadth on panels with late listings, gaps and delistings."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import breadth  # noqa: E402
+
+WINDOWS = (5, 20)
+RSI_LENGTH = 10
+
+
+def make_panel(n_coins=12, n_days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, (n_coins, n_days)), axis=1))
+    closes[1, :30] = np.nan                  # Listed late
+    closes[2, 80:] = np.nan                  # Delisted
+    closes[3, 40:45] = np.nan                # Gap
+    closes[4, :10] = np.nan                  # Listed late, gaps and delisted
+    closes[4, 50:53] = np.nan
+    closes[4, 100:] = np.nan
+    closes[5, rng.random(n_days) < 0.2] = np.nan  # Scattered gaps
+    closes[6] = np.nan                       # Never listed
+    dates = pd.date_range("2024-01-01", periods=n_days, freq="D").to_numpy()
+    coins = [f"C{i}" for i in range(n_coins)]
+    return dates, coins, closes
+
+
+def assert_matches(history, expected):
+    for name, values in expected.items():
+        np.testing.assert_allclose(np.asarray(history[name], dtype=float), values, rtol=1e-9, atol=1e-12,
+                                   equal_nan=True, err_msg=name)
+
+
+def test_from_history_matches_compute_breadth():
+    dates, coins, closes = make_panel()
+    expected = breadth.compute_breadth(closes, windows=WINDOWS, rsi_length=RSI_LENGTH)
+    _, history = breadth.BreadthState.from_history(closes, dates, coins, windows=WINDOWS, rsi_length=RSI_LENGTH)
+    assert_matches(history, expected)
+
+
+def test_update_breadth_matches_compute_breadth_incrementally(tmp_path):
+    dates, coins, closes = make_panel()
+    state_path = tmp_path / "state.npz"
+    kwargs = dict(windows=WINDOWS, rsi_length=RSI_LENGTH)
+    first = breadth.update_breadth(dates[:60], coins, closes[:, :60], state_path, **kwargs)
+    rest = breadth.update_breadth(dates, coins, closes, state_path, **kwargs)
+
+    history = pd.concat([first, rest], ignore_index=True)
+    assert_matches(history, breadth.compute_breadth(closes, **kwargs))
+
+
+def test_update_breadth_replays_added_coin_history(tmp_path):
+    dates, coins, closes = make_panel()
+    state_path = tmp_path / "state.npz"
+    kwargs = dict(windows=WINDOWS, rsi_length=RSI_LENGTH)
+    breadth.update_breadth(dates[:60], coins[:-1], closes[:-1, :60], state_path, **kwargs)
+
+    # The new coin has closes before the saved state's last date, so the whole panel is replayed
+    history = breadth.update_breadth(dates, coins, closes, state_path, **kwargs)
+    assert len(history) == len(dates)
+    assert_matches(history, breadth.compute_breadth(closes, **kwargs))
+
+
+def test_breadth_frame_rebuilds_history_without_state(tmp_path, monkeypatch):
+    dates, coins, closes = make_panel(n_days=300)
+    monkeypatch.setattr(breadth, "load_price_panel", lambda path: (dates, coins, closes))
+    state_path = tmp_path / "state.npz"
+
+    breadth.breadth_frame("panel", coins[0], state_path=state_path)
+    state_path.unlink()
+    frame = breadth.breadth_frame("panel", coins[0], state_path=state_path)
+
+    history = pd.read_parquet(state_path.with_suffix(".parquet"))
+    assert len(history) == len(dates)
+    assert history["date"].is_unique
+    assert len(frame) == len(dates)
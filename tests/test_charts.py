@@ -0,0 +1,31 @@
+"""Date range slicing and decimation of chart traces."""
+import datetime
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from charts import decimate_indices, view_slice  # noqa: E402
+
+
+def test_view_slice_keeps_the_last_day_with_a_time_of_day():
+    dates = pd.date_range("2024-01-01 05:00", periods=10, freq="D").to_numpy()
+    view = view_slice(dates, (datetime.date(2024, 1, 3), datetime.date(2024, 1, 10)))
+    assert (view.start, view.stop) == (2, 10)
+
+
+def test_view_slice_on_midnight_dates():
+    dates = pd.date_range("2024-01-01", periods=10, freq="D").to_numpy()
+    view = view_slice(dates, (datetime.date(2024, 1, 1), datetime.date(2024, 1, 5)))
+    assert (view.start, view.stop) == (0, 5)
+
+
+def test_decimate_indices_keeps_ends_and_extremes():
+    y = np.sin(np.arange(10_000) / 50.0)
+    y[1234] = 5.0
+    indices = decimate_indices(np.arange(len(y)), y, max_points=500, keep=[4321])
+    assert len(indices) <= 503
+    assert {0, len(y) - 1, 1234, 4321} <= set(indices.tolist())
@@ -0,0 +1,102 @@
+"""The pooled sheet client against a local stub server: retries, ETag revalidation and timeouts."""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import data_client  # noqa: E402
+import sheet_cache  # noqa: E402
+
+PAYLOAD = {"date": ["2024-01-01", "2024-01-02"], "btc": [0.01, -0.02]}
+ETAG = '"v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the server's queued (status, delay) responses, then 200; 304 when the ETag matches."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(dict(self.headers))
+            status, delay = server.queue.pop(0) if server.queue else (200, 0.0)
+        time.sleep(delay)
+
+        if status == 200 and self.headers.get("If-None-Match") == ETAG:
+            status = 304
+        self.send_response(status)
+        self.send_header("ETag", ETAG)
+        body = json.dumps(PAYLOAD).encode() if status == 200 else b""
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock, server.requests, server.queue = threading.Lock(), [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/exec"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    # A new session and validator store per test, without backoff sleeps
+    monkeypatch.setattr(data_client, "_session", None)
+    monkeypatch.setattr(data_client, "_validators", {})
+    monkeypatch.setattr(data_client, "BACKOFF", 0.0)
+
+
+def test_retries_server_errors(stub):
+    stub.queue += [(503, 0.0), (500, 0.0)]
+    assert data_client.get_json(stub.url, params={"sheet": "R1"}) == PAYLOAD
+    assert len(stub.requests) == 3
+
+
+def test_revalidation_returns_the_cached_payload(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(sheet_cache, "CACHE_DIR", tmp_path)
+
+    def refresh():
+        # Serve the cached frame (a refresh is due right away) and wait for the background refresh
+        frame = sheet_cache.load_sheet(stub.url, "R1", max_age=-1)
+        for _ in range(200):
+            with sheet_cache._lock:
+                if not sheet_cache._refreshing:
+                    break
+            time.sleep(0.01)
+        return frame
+
+    first = sheet_cache.load_sheet(stub.url, "R1", max_age=-1)   # Full download
+    refresh()                                                     # First incremental request stores its ETag
+    cached = sheet_cache.load_sheet(stub.url, "R1", max_age=600)
+    refresh()                                                     # Revalidated with If-None-Match
+
+    assert stub.requests[-1].get("If-None-Match") == ETAG
+    assert sheet_cache.load_sheet(stub.url, "R1", max_age=600) is cached
+    pd.testing.assert_frame_equal(cached, first)
+    assert data_client.get_json(stub.url, params={"sheet": "R1", "since": "2024-01-02"}, conditional=True) is None
+
+
+def test_read_timeout(stub):
+    stub.queue += [(200, 1.0), (200, 1.0)]
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.RequestException):
+        data_client.get_json(stub.url, params={"sheet": "R1"}, timeout=(1, 0.2))
+    # The stalled read is retried once, then the error is raised without waiting for the server
+    assert len(stub.requests) == 2
+    assert time.monotonic() - started < 1.5
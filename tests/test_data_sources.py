@@ -0,0 +1,42 @@
+"""Local Arrow snapshots: memory-mapped datasets survive a rewrite of their file."""
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Reading a mapping of a truncated file raises SIGBUS, so the scenario runs in its own process
+REWRITE_WHILE_MAPPED = textwrap.dedent("""
+    import sys
+    from pathlib import Path
+
+    import numpy as np
+    import pandas as pd
+
+    from data_sources import FileSource, write_arrow
+
+    def sheet(n_rows, offset=0.0):
+        return pd.DataFrame({"date": pd.date_range("2020-01-01", periods=n_rows),
+                             "btc": np.arange(n_rows, dtype="float64") + offset})
+
+    directory = Path(sys.argv[1])
+    write_arrow(sheet(20_000), directory / "R1.arrow")
+    source = FileSource(directory)
+    old_values = source.load_dataset("R1", trim=False)["btc"]
+
+    # A shorter rewrite leaves the old mapping past the end of the file if it is truncated in place
+    write_arrow(sheet(10, offset=0.5), directory / "R1.arrow")
+    assert old_values[-1] == 19_999.0
+    assert float(old_values.sum()) == float(np.arange(20_000).sum())
+
+    new_values = source.load_dataset("R1", trim=False)["btc"]
+    np.testing.assert_array_equal(new_values, np.arange(10) + 0.5)
+    assert [path.name for path in directory.iterdir()] == ["R1.arrow"]
+""")
+
+
+def test_rewrite_keeps_mapped_arrays_readable(tmp_path):
+    result = subprocess.run([sys.executable, "-c", REWRITE_WHILE_MAPPED, str(tmp_path)], cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr[-2000:]
@@ -0,0 +1,27 @@
+"""Uploaded TPI files become uniquely named ensemble components."""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ensemble import tpi_components, unique_names  # noqa: E402
+
+DAYS = pd.date_range("2024-01-01", periods=5)
+
+
+def test_unique_names_suffixes_repeats():
+    assert unique_names(["tpi", "tpi", "btc", "tpi (2)", "tpi"]) == ["tpi", "tpi (3)", "btc", "tpi (2)", "tpi (4)"]
+
+
+def test_tpi_components_reports_files_without_dates():
+    frames = {
+        "tpi": pd.DataFrame({"date": DAYS, "tpi": np.ones(5)}),
+        "tpi (2)": pd.DataFrame({"date": DAYS, "tpi": -np.ones(5)}),
+        "no_dates": pd.DataFrame({"tpi": np.ones(5)}),
+    }
+    components, skipped = tpi_components(frames)
+    assert list(components) == ["tpi", "tpi (2)"]
+    assert skipped == ["no_dates"]
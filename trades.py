@@ -0,0 +1,110 @@
+"""Trade ledger and trade statistics from the position changes of a thresholded TPI.
+
+A trade is a run of bars holding the same non-zero position (1 long, -1 short, as returned by
+backtest.tpi_positions), from the bar the position is entered to the bar it changes. Position
+changes are found with one diff/nonzero pass, so a 2D batch of positions (one row per threshold
+pair) is handled in O(rows x bars) array operations without per-bar Python code.
+"""
+import numpy as np
+import pandas as pd
+
+LEDGER_COLUMNS = ["Entry", "Exit", "Entry Date", "Exit Date", "Side", "Return", "Bars Held", "Open"]
+
+
+def position_changes(positions):
+    """(row, bar) indices of every position change of a position series or 2D batch, entering from cash at bar 0 included."""
+    positions = np.atleast_2d(positions)
+    changed = np.empty(positions.shape, dtype=bool)
+    changed[:, 0] = positions[:, 0] != 0
+    np.not_equal(positions[:, 1:], positions[:, :-1], out=changed[:, 1:])
+    return np.nonzero(changed)
+
+
+def _trades(positions, indexed_equity):
+    """Row, entry bar, exit bar, side and return of every trade in a 2D batch of positions.
+
+    indexed_equity holds the matching equity curves (bars + 1 values, starting at 1), so a trade's
+    return is net of the costs charged while it was open. The exit of an open trade is the bar
+    count.
+    """
+    positions = np.atleast_2d(positions)
+    equity = np.atleast_2d(np.asarray(indexed_equity, dtype=float))
+    rows, bars = position_changes(positions)
+
+    # Every change ends the previous trade of its row; the last change of a row runs to the end
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = rows[1:] != rows[:-1]
+    exits = np.empty_like(bars)
+    exits[:-1] = bars[1:]
+    exits[last] = positions.shape[1]
+
+    side = positions[rows, bars]
+    entered = side != 0
+    rows, entries, exits, side = rows[entered], bars[entered], exits[entered], side[entered]
+    returns = equity[rows, exits] / equity[rows, entries] - 1
+    return rows, entries, exits, side, returns
+
+
+def trade_ledger(positions, indexed_equity, dates=None):
+    """One row per trade of a single position series, in order.
+
+    Entry and Exit are bar indices (Exit is the bar the position changed, or the bar count for a
+    trade still open); with dates (one per bar) the matching dates are filled in.
+    """
+    positions = np.asarray(positions)
+    _, entries, exits, side, returns = _trades(positions, indexed_equity)
+    still_open = exits == len(positions)
+
+    if dates is not None:
+        dates = pd.DatetimeIndex(dates)
+        entry_dates = dates[entries]
+        exit_dates = dates[np.minimum(exits, len(positions) - 1)].where(~still_open)
+    else:
+        entry_dates = exit_dates = pd.NaT
+
+    return pd.DataFrame({
+        "Entry": entries,
+        "Exit": exits,
+        "Entry Date": entry_dates,
+        "Exit Date": exit_dates,
+        "Side": np.where(side > 0, "Long", "Short"),
+        "Return": returns,
+        "Bars Held": exits - entries,
+        "Open": still_open,
+    }, columns=LEDGER_COLUMNS)
+
+
+def trade_statistics_batch(positions, indexed_equities):
+    """Trade statistics of every row of a 2D batch of positions and their equity curves.
+
+    Every statistic is an array with one value per row; ratios are NaN for rows without trades
+    (and Profit Factor for rows without a losing trade).
+    """
+    positions = np.atleast_2d(positions)
+    rows, entries, exits, side, returns = _trades(positions, indexed_equities)
+    n_rows = positions.shape[0]
+
+    def per_row(weights=None):
+        return np.bincount(rows, weights=weights, minlength=n_rows)
+
+    count = per_row()
+    gross_profit = per_row(np.where(returns > 0, returns, 0))
+    gross_loss = -per_row(np.where(returns < 0, returns, 0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            "Trades": count,
+            "Long Trades": per_row(side > 0).astype(int),
+            "Short Trades": per_row(side < 0).astype(int),
+            "Win Rate": np.where(count > 0, per_row(returns > 0) / count, np.nan),
+            "Average Trade Return": np.where(count > 0, per_row(returns) / count, np.nan),
+            "Average Bars Held": np.where(count > 0, per_row(exits - entries) / count, np.nan),
+            "Profit Factor": np.where(gross_loss > 0, gross_profit / gross_loss, np.nan),
+            "Exposure": np.count_nonzero(positions, axis=1) / positions.shape[1],
+        }
+
+
+def trade_statistics(positions, indexed_equity):
+    """Trade statistics of a single position series, as trade_statistics_batch."""
+    statistics = trade_statistics_batch(np.asarray(positions)[None, :], np.asarray(indexed_equity, dtype=float)[None, :])
+    return {name: values[0] for name, values in statistics.items()}